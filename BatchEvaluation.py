@@ -0,0 +1,65 @@
+'''
+Scores many positions at once with numpy. The boards are encoded as an N x 12 x 64 array (one plane of 0s and 1s per piece type) and the
+material and piece square scores for all of them come out of one tensordot, the same scores GameState keeps in materialScore + positionScore.
+    scores = BatchEvaluation.evaluate([gs, 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1', ...])
+'''
+import numpy as np
+import ChessEngine
+
+planePieces = ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')
+fenPieces = np.frombuffer(b'PNBRQKpnbrqk', dtype=np.uint8) # The same pieces as FEN letters
+boardPieces = np.frombuffer(''.join(planePieces).encode(), dtype=np.uint16) # The 2 character pieces read as one 16 bit number each
+expandEmpty = str.maketrans({str(n): '.' * n for n in range(1, 9)} | {'/': ''}) # FEN board to 64 characters, '.' for an empty square
+# Score of every piece on every square in centipawns, positive for white, from ChessEngine.pieceScore and the piece square tables
+squareWeights = np.array([[ChessEngine.pieceMaterial[piece] + ChessEngine.piecePositionScores[piece][square] for square in range(64)]
+                          for piece in planePieces], dtype=np.int32)
+
+'''
+Encode positions, each a GameState or a FEN string, as an N x 12 x 64 uint8 array. Squares are row * 8 + col with row 0 the 8th rank
+'''
+def encodeBoards(positions):
+    planes = np.zeros((len(positions), 12, 64), dtype=np.uint8)
+    fens = [n for n in range(len(positions)) if isinstance(positions[n], str)]
+    states = [n for n in range(len(positions)) if not isinstance(positions[n], str)]
+    # Compare every square of every board with each piece at once, instead of looking at the squares one by one in Python
+    if fens:
+        squares = np.frombuffer(''.join(positions[n].split()[0].translate(expandEmpty) for n in fens).encode(), dtype=np.uint8).reshape(len(fens), 64)
+        planes[fens] = squares[:, None, :] == fenPieces[None, :, None]
+    if states:
+        squares = np.frombuffer(''.join(''.join(row) for n in states for row in positions[n].board).encode(), dtype=np.uint16).reshape(len(states), 64)
+        planes[states] = squares[:, None, :] == boardPieces[None, :, None]
+    return planes
+
+'''
+Material plus piece square score of every position in centipawns, positive is good for white. Takes encoded planes or a list of positions
+'''
+def evaluate(positions):
+    planes = positions if isinstance(positions, np.ndarray) else encodeBoards(positions)
+    return np.tensordot(planes.astype(np.int32), squareWeights, axes=([1, 2], [0, 1]))
+
+'''
+The same scores from the point of view of the side to move, like the search uses. Takes a list of GameStates and FEN strings, or encoded
+planes together with whiteToMove (one bool per board), since the planes don't say whose move it is
+'''
+def evaluateSideToMove(positions, whiteToMove=None):
+    if whiteToMove is None:
+        if isinstance(positions, np.ndarray):
+            raise TypeError('Encoded planes need whiteToMove, they have no side to move')
+        whiteToMove = [isWhiteToMove(position) for position in positions]
+    whiteToMove = np.asarray(whiteToMove, dtype=bool)
+    if whiteToMove.shape != (len(positions),):
+        raise ValueError('whiteToMove needs one value per position, got ' + str(whiteToMove.shape) + ' for ' + str(len(positions)))
+    return np.where(whiteToMove, 1, -1) * evaluate(positions)
+
+'''
+Side to move of a GameState or FEN string. Raises ValueError for a FEN without a w or b side to move field, and TypeError for anything else
+'''
+def isWhiteToMove(position):
+    if isinstance(position, str):
+        fields = position.split()
+        if len(fields) < 2 or fields[1] not in ('w', 'b'):
+            raise ValueError('FEN side to move has to be w or b: ' + repr(position))
+        return fields[1] == 'w'
+    if isinstance(position, ChessEngine.GameState):
+        return position.whiteToMove
+    raise TypeError('Positions are GameStates or FEN strings, not ' + type(position).__name__)
@@ -2,8 +2,109 @@
 Responsible for storing all the information about the current state of a chess game. It will also be resposible for determining the valid moves at the current state.
 It will also keep a move log.
 '''
+import random
+
+'''
+Zobrist keys. Every piece on every square, castling right, en passant file and black to move gets a random 64 bit number and the key of a
+position is all the numbers for what is in it xored together. Fixed seed so keys are the same every run
+'''
+zobristRandom = random.Random(20240601)
+zobristPieces = {piece: [zobristRandom.getrandbits(64) for square in range(64)] for piece in ('wp', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK')}
+zobristCastling = [zobristRandom.getrandbits(64) for right in range(4)] # wks, bks, wqs, bqs
+zobristEnPassant = [zobristRandom.getrandbits(64) for col in range(8)]
+zobristBlackToMove = zobristRandom.getrandbits(64)
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+'''
+Evaluation tables. pieceScore is the material value of a piece in pawns, the piece square tables are a bonus in centipawns for a piece standing
+on a square, laid out the way white sees the board (row 0 is the 8th rank). Black uses them flipped top to bottom
+'''
+pieceScore = {'K': 0, 'Q': 10, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
+pawnSquareScores = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [50, 50, 50, 50, 50, 50, 50, 50],
+    [10, 10, 20, 30, 30, 20, 10, 10],
+    [5, 5, 10, 25, 25, 10, 5, 5],
+    [0, 0, 0, 20, 20, 0, 0, 0],
+    [5, -5, -10, 0, 0, -10, -5, 5],
+    [5, 10, 10, -20, -20, 10, 10, 5],
+    [0, 0, 0, 0, 0, 0, 0, 0]]
+knightSquareScores = [
+    [-50, -40, -30, -30, -30, -30, -40, -50],
+    [-40, -20, 0, 0, 0, 0, -20, -40],
+    [-30, 0, 10, 15, 15, 10, 0, -30],
+    [-30, 5, 15, 20, 20, 15, 5, -30],
+    [-30, 0, 15, 20, 20, 15, 0, -30],
+    [-30, 5, 10, 15, 15, 10, 5, -30],
+    [-40, -20, 0, 5, 5, 0, -20, -40],
+    [-50, -40, -30, -30, -30, -30, -40, -50]]
+bishopSquareScores = [
+    [-20, -10, -10, -10, -10, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 10, 10, 5, 0, -10],
+    [-10, 5, 5, 10, 10, 5, 5, -10],
+    [-10, 0, 10, 10, 10, 10, 0, -10],
+    [-10, 10, 10, 10, 10, 10, 10, -10],
+    [-10, 5, 0, 0, 0, 0, 5, -10],
+    [-20, -10, -10, -10, -10, -10, -10, -20]]
+rookSquareScores = [
+    [0, 0, 0, 0, 0, 0, 0, 0],
+    [5, 10, 10, 10, 10, 10, 10, 5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [-5, 0, 0, 0, 0, 0, 0, -5],
+    [0, 0, 0, 5, 5, 0, 0, 0]]
+queenSquareScores = [
+    [-20, -10, -10, -5, -5, -10, -10, -20],
+    [-10, 0, 0, 0, 0, 0, 0, -10],
+    [-10, 0, 5, 5, 5, 5, 0, -10],
+    [-5, 0, 5, 5, 5, 5, 0, -5],
+    [0, 0, 5, 5, 5, 5, 0, -5],
+    [-10, 5, 5, 5, 5, 5, 0, -10],
+    [-10, 0, 5, 0, 0, 0, 0, -10],
+    [-20, -10, -10, -5, -5, -10, -10, -20]]
+kingSquareScores = [
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-30, -40, -40, -50, -50, -40, -40, -30],
+    [-20, -30, -30, -40, -40, -30, -30, -20],
+    [-10, -20, -20, -20, -20, -20, -20, -10],
+    [20, 20, 0, 0, 0, 0, 20, 20],
+    [20, 30, 10, 0, 0, 10, 30, 20]]
+pieceSquareScores = {'p': pawnSquareScores, 'N': knightSquareScores, 'B': bishopSquareScores, 'R': rookSquareScores, 'Q': queenSquareScores, 'K': kingSquareScores}
+# Material in centipawns and square bonus for every piece, both positive for white and negative for black, the square bonus indexed by row * 8 + col
+pieceMaterial = {'--': 0}
+piecePositionScores = {'--': [0] * 64}
+for piece in pieceScore:
+    pieceMaterial['w' + piece] = pieceScore[piece] * 100
+    pieceMaterial['b' + piece] = -pieceScore[piece] * 100
+    piecePositionScores['w' + piece] = [pieceSquareScores[piece][r][c] for r in range(8) for c in range(8)]
+    piecePositionScores['b' + piece] = [-pieceSquareScores[piece][7 - r][c] for r in range(8) for c in range(8)]
+
+'''
+The part of the Zobrist key for a set of castle rights
+'''
+def zobristCastlingKey(castleRights):
+    key = 0
+    if castleRights.wks:
+        key ^= zobristCastling[0]
+    if castleRights.bks:
+        key ^= zobristCastling[1]
+    if castleRights.wqs:
+        key ^= zobristCastling[2]
+    if castleRights.bqs:
+        key ^= zobristCastling[3]
+    return key
+
 class GameState():
-    def __init__(self):
+    checkZobristKey = False # Debug mode, recompute the key from scratch after every make/undo and raise if the incremental one differs
+    checkScores = False # Debug mode, the same for materialScore and positionScore
+
+    def __init__(self, fen=None):
         # The board is an 8x8 2d list, each element of the list has 2 characters.
         # The first character represents the color of the piece, 'b' or 'w'
         # The second character represents the type of the piece, 'K', 'Q', 'R', 'B', 'N' or 'P'
@@ -26,13 +127,191 @@ class GameState():
         self.checkmate = False
         self.stalemate = False
         self.enPassantPossible = () # Coordinates for the square where en passant capture is possible
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.pins = {} # Pinned pieces of the side to move while legal moves are being generated, (row, col): pin direction
+        self.capturesOnly = False # While set the generators only add captures and promotions, quiet moves are never made
+        self.currentCastlingRight = CastleRights(True, True, True, True) # Never changed in place, makeMove swaps in a new one when a right is lost
+        self.halfmoveClock = 0 # Moves since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1 # Goes up after every black move
+        self.zobristKey = self.computeZobristKey() # 64 bit key of the position, updated by makeMove and undoMove
+        # Running evaluation in centipawns, white minus black, updated by makeMove and undoMove so the search doesn't have to scan the board
+        self.materialScore, self.positionScore = self.computeScores()
+        self.pieceCount = 32 # Pieces on the board, kings included
+        # One tuple per move in moveLog with what makeMove can't work backwards from: (castle rights, en passant square, halfmove clock,
+        # Zobrist key, material score, position score) from before the move. undoMove pops it and puts them back as they were
+        self.undoLog = []
+        if fen is not None:
+            self.loadFEN(fen)
+
+    '''
+    Set up the position from a FEN string. The move log starts over, so moves made before can't be undone
+    '''
+    def loadFEN(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError('FEN needs at least the board, side to move, castling and en passant fields: ' + fen)
+        rows = fields[0].split('/')
+        if len(rows) != 8:
+            raise ValueError('FEN board needs 8 ranks: ' + fen)
+        board = []
+        for r in range(8):
+            row = []
+            for char in rows[r]:
+                if char.isdigit():
+                    row.extend(['--'] * int(char))
+                elif char.upper() in 'PNBRQK':
+                    color = 'w' if char.isupper() else 'b'
+                    row.append(color + ('p' if char.upper() == 'P' else char.upper()))
+                    if char == 'K':
+                        self.whiteKingLocation = (r, len(row) - 1)
+                    elif char == 'k':
+                        self.blackKingLocation = (r, len(row) - 1)
+                else:
+                    raise ValueError('Unknown piece ' + repr(char) + ' in FEN: ' + fen)
+            if len(row) != 8:
+                raise ValueError('FEN rank ' + rows[r] + ' is not 8 squares: ' + fen)
+            board.append(row)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError('FEN side to move has to be w or b: ' + fen)
+        self.board = board
+        self.whiteToMove = fields[1] == 'w'
+        castling = fields[2]
+        self.currentCastlingRight = CastleRights('K' in castling, 'k' in castling, 'Q' in castling, 'q' in castling)
+        if fields[3] == '-':
+            self.enPassantPossible = ()
+        else:
+            self.enPassantPossible = (Move.ranksToRows[fields[3][1]], Move.filesToCols[fields[3][0]])
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+
+        self.moveLog = []
+        self.undoLog = []
+        self.checkmate = False
+        self.stalemate = False
+        self.zobristKey = self.computeZobristKey()
+        self.materialScore, self.positionScore = self.computeScores()
+        self.pieceCount = sum(square != '--' for row in self.board for square in row)
+
+    '''
+    The FEN string of the current position
+    '''
+    def getFEN(self):
+        rows = []
+        for row in self.board:
+            fenRow = ''
+            empty = 0
+            for square in row:
+                if square == '--':
+                    empty += 1
+                else:
+                    if empty > 0:
+                        fenRow += str(empty)
+                        empty = 0
+                    piece = 'P' if square[1] == 'p' else square[1]
+                    fenRow += piece if square[0] == 'w' else piece.lower()
+            if empty > 0:
+                fenRow += str(empty)
+            rows.append(fenRow)
+        castling = ''
+        if self.currentCastlingRight.wks:
+            castling += 'K'
+        if self.currentCastlingRight.wqs:
+            castling += 'Q'
+        if self.currentCastlingRight.bks:
+            castling += 'k'
+        if self.currentCastlingRight.bqs:
+            castling += 'q'
+        if self.enPassantPossible == ():
+            enPassant = '-'
+        else:
+            enPassant = Move.colsToFiles[self.enPassantPossible[1]] + Move.rowsToRanks[self.enPassantPossible[0]]
+        return ' '.join(('/'.join(rows), 'w' if self.whiteToMove else 'b', castling or '-', enPassant, str(self.halfmoveClock), str(self.fullmoveNumber)))
+
+    '''
+    Find the valid move written as text, either in coordinates like Move.getChessNotation (e2e4, e7e8q) or in standard algebraic notation
+    (e4, Nxf3+, exd6, O-O, e8=Q). Raises ValueError when no valid move, or more than one, matches
+    '''
+    def parseMove(self, text):
+        validMoves = self.getValidMoves()
+        san = text.rstrip('+#!?')
+        for move in validMoves: # Coordinates
+            if move.getChessNotation() == san:
+                return move
+        if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+            endCol = 6 if len(san) == 3 else 2
+            matches = [move for move in validMoves if move.isCastleMove and move.endCol == endCol]
+        else:
+            promotionPiece = None
+            if '=' in san:
+                san, promotionPiece = san.split('=')
+            elif san[-1:] in ('Q', 'R', 'B', 'N') and san[:1].islower(): # e8Q
+                san, promotionPiece = san[:-1], san[-1]
+            piece = san[0] if san[:1] in ('K', 'Q', 'R', 'B', 'N') else 'p'
+            if piece != 'p':
+                san = san[1:]
+            san = san.replace('x', '')
+            if len(san) < 2 or san[-2] not in Move.filesToCols or san[-1] not in Move.ranksToRows:
+                raise ValueError('Not a move: ' + text)
+            endRow, endCol = Move.ranksToRows[san[-1]], Move.filesToCols[san[-2]]
+            fromFile = fromRank = None # Disambiguation
+            for char in san[:-2]:
+                if char in Move.filesToCols:
+                    fromFile = Move.filesToCols[char]
+                elif char in Move.ranksToRows:
+                    fromRank = Move.ranksToRows[char]
+                else:
+                    raise ValueError('Not a move: ' + text)
+            matches = [move for move in validMoves if move.endRow == endRow and move.endCol == endCol and move.pieceMoved[1] == piece and
+                       move.promotionPiece == promotionPiece and not move.isCastleMove and
+                       (fromFile is None or move.startCol == fromFile) and (fromRank is None or move.startRow == fromRank)]
+        if len(matches) != 1:
+            raise ValueError(('Ambiguous move: ' if matches else 'Not a valid move: ') + text + ' in ' + self.getFEN())
+        return matches[0]
+
+    '''
+    A valid move of the current position in standard algebraic notation (Nbd7, exd5, O-O, e8=Q+), for PGN
+    '''
+    def getSAN(self, move):
+        validMoves = self.getValidMoves()
+        if move.isCastleMove:
+            san = 'O-O' if move.endCol == 6 else 'O-O-O'
+        else:
+            piece = move.pieceMoved[1]
+            target = move.getRankFile(move.endRow, move.endCol)
+            if piece == 'p':
+                san = (move.colsToFiles[move.startCol] + 'x' if move.pieceCaptured != '--' else '') + target
+                if move.promotionPiece is not None:
+                    san += '=' + move.promotionPiece
+            else:
+                # Say which piece moved when another of the same kind could go to the same square
+                others = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other.endRow == move.endRow and
+                          other.endCol == move.endCol and (other.startRow, other.startCol) != (move.startRow, move.startCol)]
+                fromSquare = ''
+                if others:
+                    if all(other.startCol != move.startCol for other in others):
+                        fromSquare = move.colsToFiles[move.startCol]
+                    elif all(other.startRow != move.startRow for other in others):
+                        fromSquare = move.rowsToRanks[move.startRow]
+                    else:
+                        fromSquare = move.getRankFile(move.startRow, move.startCol)
+                san = piece + fromSquare + ('x' if move.pieceCaptured != '--' else '') + target
+        self.makeMove(move)
+        if self.inCheck():
+            san += '#' if len(self.getValidMoves()) == 0 else '+'
+        self.undoMove()
+        self.checkmate = self.stalemate = False
+        return san
 
     '''
     Takes a Move as a parameter and executes it (this will not work for castling, pawn promotion, and en-passant)
     '''
     def makeMove(self, move):
+        move.loadPieces() # Move looks its pieces up lazily, so this has to happen before the board changes
+        castleRights = self.currentCastlingRight
+        self.undoLog.append((castleRights, self.enPassantPossible, self.halfmoveClock, self.zobristKey, self.materialScore, self.positionScore))
+        # Take the side to move and en passant square out of the key, they are put back once they are updated
+        key = self.zobristKey ^ zobristBlackToMove
+        if self.enPassantPossible != ():
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
         self.board[move.startRow][move.startCol] = '--'
         self.board[move.endRow][move.endCol] = move.pieceMoved
         self.moveLog.append(move) # Log the move
@@ -43,10 +322,9 @@ class GameState():
         elif move.pieceMoved == 'bK':
             self.blackKingLocation = (move.endRow, move.endCol)
         
-        # Pawn promotion
+        # Pawn promotion, the piece is part of the move (a queen if whoever made the move didn't pick one)
         if move.isPawnPromotion:
-            promotedPiece = input('Promote to Q, R, B, or N:')
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotedPiece
+            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + (move.promotionPiece or 'Q')
 
         # Enpassant move
         if move.isEnpassantMove:
@@ -58,6 +336,16 @@ class GameState():
         else:
             self.enPassantPossible = ()
 
+        # Update the move counters
+        if move.pieceCaptured != '--':
+            self.pieceCount -= 1
+        if move.pieceMoved[1] == 'p' or move.pieceCaptured != '--':
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if move.pieceMoved[0] == 'b':
+            self.fullmoveNumber += 1
+
         # Castle move
         if move.isCastleMove:
             if move.endCol - move.startCol == 2: # Kingside castle move
@@ -68,7 +356,46 @@ class GameState():
                 self.board[move.endRow][move.endCol-2] = '--' # Erases old rook
         # Updated castling rights
         self.updateCastleRights(move)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+
+        # Update the Zobrist key
+        key ^= zobristPieces[move.pieceMoved][move.startRow * 8 + move.startCol]
+        key ^= zobristPieces[self.board[move.endRow][move.endCol]][move.endRow * 8 + move.endCol] # Promoted piece if there was a promotion
+        if move.isEnpassantMove:
+            key ^= zobristPieces[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != '--':
+            key ^= zobristPieces[move.pieceCaptured][move.endRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rook = move.pieceMoved[0] + 'R'
+            if move.endCol - move.startCol == 2: # Kingside
+                key ^= zobristPieces[rook][move.endRow * 8 + 7] ^ zobristPieces[rook][move.endRow * 8 + 5]
+            else: # Queenside
+                key ^= zobristPieces[rook][move.endRow * 8] ^ zobristPieces[rook][move.endRow * 8 + 3]
+        if self.currentCastlingRight is not castleRights: # A right was lost
+            key ^= zobristCastlingKey(castleRights) ^ zobristCastlingKey(self.currentCastlingRight)
+        if self.enPassantPossible != ():
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
+        self.zobristKey = key
+        if self.checkZobristKey:
+            self.verifyZobristKey()
+
+        # Update the running scores, the same squares change as for the key
+        endPiece = self.board[move.endRow][move.endCol]
+        materialScore = self.materialScore + pieceMaterial[endPiece] - pieceMaterial[move.pieceMoved] - pieceMaterial[move.pieceCaptured]
+        positionScore = self.positionScore + piecePositionScores[endPiece][move.endRow * 8 + move.endCol] - piecePositionScores[move.pieceMoved][move.startRow * 8 + move.startCol]
+        if move.isEnpassantMove:
+            positionScore -= piecePositionScores[move.pieceCaptured][move.startRow * 8 + move.endCol]
+        elif move.pieceCaptured != '--':
+            positionScore -= piecePositionScores[move.pieceCaptured][move.endRow * 8 + move.endCol]
+        if move.isCastleMove:
+            rookScores = piecePositionScores[move.pieceMoved[0] + 'R']
+            if move.endCol - move.startCol == 2: # Kingside
+                positionScore += rookScores[move.endRow * 8 + 5] - rookScores[move.endRow * 8 + 7]
+            else: # Queenside
+                positionScore += rookScores[move.endRow * 8 + 3] - rookScores[move.endRow * 8]
+        self.materialScore = materialScore
+        self.positionScore = positionScore
+        if self.checkScores:
+            self.verifyScores()
 
     '''
     Undo the last move made
@@ -88,14 +415,12 @@ class GameState():
                 if move.isEnpassantMove:
                     self.board[move.endRow][move.endCol] = '--' # Leave landing square blank
                     self.board[move.startRow][move.endCol] = move.pieceCaptured
-                    self.enPassantPossible = (move.endRow, move.endCol)
-                # Undo a 2 square pawn advance should make enPassantPossible = () again
-                if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                    self.enPassantPossible = ()
-                # Undo castling rights
-#               self.castleRightsLog.pop() # Get rid of the new castle rights from the move we are undoing
-#               newRights = self.castleRightsLog[-1]
-#               self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+                # Put back the castle rights, en passant square, move counters, key and scores from before the move
+                self.currentCastlingRight, self.enPassantPossible, self.halfmoveClock, self.zobristKey, self.materialScore, self.positionScore = self.undoLog.pop()
+                if move.pieceCaptured != '--':
+                    self.pieceCount += 1
+                if move.pieceMoved[0] == 'b':
+                    self.fullmoveNumber -= 1
                 # Undo castle move
                 if move.isCastleMove:
                     if move.endCol - move.startCol == 2: # Kingside
@@ -104,37 +429,162 @@ class GameState():
                     else: # Queenside
                         self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
                         self.board[move.endRow][move.endCol+1] = '--'
+                if self.checkZobristKey:
+                    self.verifyZobristKey()
+                if self.checkScores:
+                    self.verifyScores()
+
+    '''
+    Compute the Zobrist key of the position from scratch
+    '''
+    def computeZobristKey(self):
+        key = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    key ^= zobristPieces[piece][r * 8 + c]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        key ^= zobristCastlingKey(self.currentCastlingRight)
+        if self.enPassantPossible != ():
+            key ^= zobristEnPassant[self.enPassantPossible[1]]
+        return key
+
+    '''
+    Debug check that the incrementally updated Zobrist key matches the position
+    '''
+    def verifyZobristKey(self):
+        if self.zobristKey != self.computeZobristKey():
+            raise AssertionError('Zobrist key out of date after ' + ' '.join(move.getChessNotation() for move in self.moveLog))
 
     '''
-    Update the castle rights given the move
+    Compute (materialScore, positionScore) of the position from scratch
+    '''
+    def computeScores(self):
+        materialScore = 0
+        positionScore = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                materialScore += pieceMaterial[piece]
+                positionScore += piecePositionScores[piece][r * 8 + c]
+        return materialScore, positionScore
+
+    '''
+    Debug check that the running scores match the position
+    '''
+    def verifyScores(self):
+        if (self.materialScore, self.positionScore) != self.computeScores():
+            raise AssertionError('Running scores out of date after ' + ' '.join(move.getChessNotation() for move in self.moveLog))
+
+    '''
+    Update the castle rights given the move. The rights are swapped for a new CastleRights when one is lost, the old one stays as it was
+    for undoMove
     '''
     def updateCastleRights(self, move):
+        rights = self.currentCastlingRight
+        wks, bks, wqs, bqs = rights.wks, rights.bks, rights.wqs, rights.bqs
         if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
+            wks = wqs = False
         elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
+            bks = bqs = False
         elif move.pieceMoved == 'wR':
             if move.startRow == 7:
                 if move.startCol == 0: # Left rook
-                    self.currentCastlingRight.wqs = False
+                    wqs = False
                 elif move.startCol == 7: # Right rook
-                    self.currentCastlingRight.wks = False
+                    wks = False
         elif move.pieceMoved == 'bR':
             if move.startRow == 0:
                 if move.startCol == 0: # Left rook
-                    self.currentCastlingRight.bqs = False
+                    bqs = False
                 elif move.startCol == 7: # Right rook
-                    self.currentCastlingRight.bks = False
+                    bks = False
+        # A rook captured on its starting square can't castle anymore either
+        if move.pieceCaptured == 'wR':
+            if move.endRow == 7:
+                if move.endCol == 0:
+                    wqs = False
+                elif move.endCol == 7:
+                    wks = False
+        elif move.pieceCaptured == 'bR':
+            if move.endRow == 0:
+                if move.endCol == 0:
+                    bqs = False
+                elif move.endCol == 7:
+                    bks = False
+        if wks != rights.wks or bks != rights.bks or wqs != rights.wqs or bqs != rights.bqs:
+            self.currentCastlingRight = CastleRights(wks, bks, wqs, bqs)
+
+    '''
+    How many times the current position has been on the board, this time included. Only positions since the last capture or pawn move
+    with the same side to move can be the same
+    '''
+    def getRepetitions(self):
+        count = 1
+        for i in range(len(self.undoLog) - 2, len(self.undoLog) - 1 - self.halfmoveClock, -2):
+            if i < 0:
+                break
+            if self.undoLog[i][3] == self.zobristKey:
+                count += 1
+        return count
+
+    '''
+    All moves considering checks. Pins and checks are found once from the king's square so only legal moves get generated.
+    With capturesOnly just the legal captures and promotions are generated, and checkmate and stalemate are left alone
+    '''
+    def getValidMoves(self, capturesOnly=False):
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck, pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        self.pins = pins # Generators leave pinned pieces on their pin line
+        self.capturesOnly = capturesOnly
+        if len(checks) > 1: # Double check, the king has to move
+            moves = []
+            self.getKingMoves(kingRow, kingCol, moves)
+        else:
+            moves = self.getAllPossibleMoves()
+        self.pins = {}
+        self.capturesOnly = False
+
+        validSquares = None # Squares a non-king move has to land on to get out of a single check
+        if len(checks) == 1:
+            checkRow, checkCol, dr, dc = checks[0]
+            if self.board[checkRow][checkCol][1] == 'N': # Knight checks can't be blocked
+                validSquares = {(checkRow, checkCol)}
+            else:
+                validSquares = set()
+                for i in range(1, 8):
+                    validSquare = (kingRow + dr * i, kingCol + dc * i)
+                    validSquares.add(validSquare)
+                    if validSquare == (checkRow, checkCol): # Reached the checking piece
+                        break
+
+        for i in range(len(moves)-1, -1, -1): # When removing from a list go backwards through that list
+            move = moves[i]
+            if (move.startRow == kingRow and move.startCol == kingCol) or move.isEnpassantMove: # Play these on the board to see if the king is still safe
+                if self.exposesKing(move):
+                    del moves[i]
+            elif validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+                del moves[i]
+
+        if capturesOnly:
+            return moves
+        if not inCheck:
+            self.getCastleMoves(kingRow, kingCol, moves)
+
+        self.checkmate = len(moves) == 0 and inCheck
+        self.stalemate = len(moves) == 0 and not inCheck
+        return moves
 
     '''
-    All moves considering checks
+    All moves considering checks by playing every move and seeing if it leaves the king in check. Much slower than getValidMoves, it is kept as a reference to test it against
     '''
-    def getValidMoves(self):
+    def getValidMovesByFiltering(self):
         moves = self.getAllPossibleMoves()
-        tempEnpassantPossible = self.enPassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)
         for i in range(len(moves)-1, -1, -1): # When removing from a list go backwards through that list
             self.makeMove(moves[i])
             self.whiteToMove = not self.whiteToMove
@@ -148,15 +598,95 @@ class GameState():
                 self.checkmate = True
             else:
                 self.stalemate = True
-        
+
         if self.whiteToMove:
             self.getCastleMoves(self.whiteKingLocation[0], self.whiteKingLocation[1], moves)
         else:
             self.getCastleMoves(self.blackKingLocation[0], self.blackKingLocation[1], moves)
-            self.enPassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = tempCastleRights
         return moves
-    
+
+    '''
+    Look outward from the square r, c (the king of the side to move) and return if it is in check, the pinned allied pieces and the checking pieces
+    '''
+    def checkForPinsAndChecks(self, r, c):
+        pins = {} # (row, col) of a pinned allied piece: direction of the pin from the king
+        checks = [] # (row, col, dr, dc) for every enemy piece giving check
+        inCheck = False
+        if self.whiteToMove:
+            enemyColor = 'b'
+            allyColor = 'w'
+            pawnRow = -1 # Row direction from the king to an enemy pawn that attacks it
+        else:
+            enemyColor = 'w'
+            allyColor = 'b'
+            pawnRow = 1
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(len(directions)):
+            d = directions[j]
+            possiblePin = () # Reset possible pins
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = self.board[endRow][endCol]
+                    if endPiece[0] == allyColor:
+                        if possiblePin == (): # First allied piece could be pinned
+                            possiblePin = (endRow, endCol)
+                        else: # Second allied piece, so no pin or check possible in this direction
+                            break
+                    elif endPiece[0] == enemyColor:
+                        pieceType = endPiece[1]
+                        # 1. Orthogonally away from the king and the piece is a rook
+                        # 2. Diagonally away from the king and the piece is a bishop
+                        # 3. 1 square away diagonally from the king and the piece is a pawn
+                        # 4. Any direction and the piece is a queen
+                        if (j <= 3 and pieceType == 'R') or (j >= 4 and pieceType == 'B') or \
+                                (i == 1 and pieceType == 'p' and d[0] == pawnRow and j >= 4) or pieceType == 'Q':
+                            if possiblePin == (): # No piece blocking, so check
+                                inCheck = True
+                                checks.append((endRow, endCol, d[0], d[1]))
+                            else: # Piece blocking, so pin
+                                pins[possiblePin] = d
+                        break # Enemy piece that isn't applying a check or pin
+                else: # Off board
+                    break
+        # Check for knight checks
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = self.board[endRow][endCol]
+                if endPiece[0] == enemyColor and endPiece[1] == 'N': # Enemy knight attacking the king
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    '''
+    Play a king or en passant move on the board only and see if it leaves the king of the side to move in check
+    '''
+    def exposesKing(self, move):
+        move.loadPieces()
+        self.board[move.startRow][move.startCol] = '--'
+        self.board[move.endRow][move.endCol] = move.pieceMoved
+        if move.isEnpassantMove:
+            self.board[move.startRow][move.endCol] = '--' # Capturing the pawn can uncover an attack along the rank
+        if move.pieceMoved[1] == 'K':
+            kingRow, kingCol = move.endRow, move.endCol
+        elif self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck = self.squareUnderAttack(kingRow, kingCol)
+        # Put the board back
+        self.board[move.startRow][move.startCol] = move.pieceMoved
+        if move.isEnpassantMove:
+            self.board[move.endRow][move.endCol] = '--'
+            self.board[move.startRow][move.endCol] = move.pieceCaptured
+        else:
+            self.board[move.endRow][move.endCol] = move.pieceCaptured
+        return inCheck
+
     '''
     Determine if the player is in check
     '''
@@ -170,14 +700,102 @@ class GameState():
     Determine if the enemy can attack the square r, c
     '''
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove # Switch to opponent's turn
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove # Switch turns back
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c: # Square is under attack
+        return self.squareAttackedBy(r, c, 'b' if self.whiteToMove else 'w')
+
+    '''
+    Determine if a piece of attackerColor attacks the square r, c. Looks outward from the square along knight, pawn, king and sliding piece
+    patterns instead of generating moves, so nothing gets allocated
+    '''
+    def squareAttackedBy(self, r, c, attackerColor):
+        board = self.board
+        if attackerColor == 'w':
+            pawn, knight, bishop, rook, queen, king = 'wp', 'wN', 'wB', 'wR', 'wQ', 'wK'
+            pawnRow = r + 1 # White pawns attack up the board, so they sit on the row below
+        else:
+            pawn, knight, bishop, rook, queen, king = 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK'
+            pawnRow = r - 1
+        # Pawns
+        if 0 <= pawnRow < 8:
+            if c-1 >= 0 and board[pawnRow][c-1] == pawn:
                 return True
+            if c+1 <= 7 and board[pawnRow][c+1] == pawn:
+                return True
+        # Knights
+        for m in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == knight:
+                return True
+        # King
+        for m in ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)):
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == king:
+                return True
+        # Rooks and queens along ranks and files
+        for d in ((-1, 0), (0, -1), (1, 0), (0, 1)):
+            endRow = r + d[0]
+            endCol = c + d[1]
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece != '--': # First piece in this direction blocks the rest
+                    if endPiece == rook or endPiece == queen:
+                        return True
+                    break
+                endRow += d[0]
+                endCol += d[1]
+        # Bishops and queens along diagonals
+        for d in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+            endRow = r + d[0]
+            endCol = c + d[1]
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece != '--':
+                    if endPiece == bishop or endPiece == queen:
+                        return True
+                    break
+                endRow += d[0]
+                endCol += d[1]
         return False
 
+    '''
+    All the squares (row, col) holding a piece of attackerColor that attacks the square r, c
+    '''
+    def getAttackers(self, r, c, attackerColor):
+        attackers = []
+        board = self.board
+        if attackerColor == 'w':
+            pawn, knight, bishop, rook, queen, king = 'wp', 'wN', 'wB', 'wR', 'wQ', 'wK'
+            pawnRow = r + 1
+        else:
+            pawn, knight, bishop, rook, queen, king = 'bp', 'bN', 'bB', 'bR', 'bQ', 'bK'
+            pawnRow = r - 1
+        if 0 <= pawnRow < 8:
+            if c-1 >= 0 and board[pawnRow][c-1] == pawn:
+                attackers.append((pawnRow, c-1))
+            if c+1 <= 7 and board[pawnRow][c+1] == pawn:
+                attackers.append((pawnRow, c+1))
+        for m in ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)):
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8 and board[endRow][endCol] == knight:
+                attackers.append((endRow, endCol))
+        for d in ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)):
+            slider = rook if d[0] == 0 or d[1] == 0 else bishop
+            endRow = r + d[0]
+            endCol = c + d[1]
+            distance = 1
+            while 0 <= endRow < 8 and 0 <= endCol < 8:
+                endPiece = board[endRow][endCol]
+                if endPiece != '--':
+                    if endPiece == slider or endPiece == queen or (distance == 1 and endPiece == king):
+                        attackers.append((endRow, endCol))
+                    break
+                endRow += d[0]
+                endCol += d[1]
+                distance += 1
+        return attackers
+
     '''
     All moves without considering checks
     '''
@@ -195,52 +813,68 @@ class GameState():
     Get all the pawn moves for the pawn located at row, col and ad these moves to the list
     '''
     def getPawnMoves(self, r, c, moves):
+        pinDirection = self.pins.get((r, c))
         if self.whiteToMove: # White pawn moves
-            if self.board[r-1][c] == '--': # 1 square pawn advance
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == '--': # 2 square pawn advances
+            if self.board[r-1][c] == '--' and (pinDirection is None or pinDirection[1] == 0) and (not self.capturesOnly or r-1 == 0): # 1 square pawn advance
+                self.addPawnMove((r, c), (r-1, c), moves)
+                if r == 6 and self.board[r-2][c] == '--' and not self.capturesOnly: # 2 square pawn advances
                     moves.append(Move((r, c), (r-2, c), self.board))
             # Captures
-            if c-1 >= 0: # Captures to the left
+            if c-1 >= 0 and (pinDirection is None or pinDirection in ((-1, -1), (1, 1))): # Captures to the left
                 if self.board[r-1][c-1][0] == 'b': # Enemy piece to capture
-                    moves.append(Move((r, c), (r-1, c-1), self.board))
+                    self.addPawnMove((r, c), (r-1, c-1), moves)
                 elif (r-1, c-1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: # Captures to the right
+            if c+1 <= 7 and (pinDirection is None or pinDirection in ((-1, 1), (1, -1))): # Captures to the right
                 if self.board[r-1][c+1][0] == 'b':
-                    moves.append(Move((r, c), (r-1, c+1), self.board))
+                    self.addPawnMove((r, c), (r-1, c+1), moves)
                 elif (r-1, c+1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
         else: # Black pawn moves
-            if self.board[r+1][c] == '--': # 1 square move
-                moves.append(Move((r, c), (r+1, c), self.board))
-                if r == 1 and self.board[r+2][c] == '--': # 2 square move
+            if self.board[r+1][c] == '--' and (pinDirection is None or pinDirection[1] == 0) and (not self.capturesOnly or r+1 == 7): # 1 square move
+                self.addPawnMove((r, c), (r+1, c), moves)
+                if r == 1 and self.board[r+2][c] == '--' and not self.capturesOnly: # 2 square move
                     moves.append(Move((r, c), (r+2, c), self.board))
             # Captures
-            if c-1 >= 0: # Captures to the left
+            if c-1 >= 0 and (pinDirection is None or pinDirection in ((1, -1), (-1, 1))): # Captures to the left
                 if self.board[r+1][c-1][0] == 'w':
-                    moves.append(Move((r, c), (r+1, c-1), self.board))
+                    self.addPawnMove((r, c), (r+1, c-1), moves)
                 elif (r+1, c-1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r+1, c-1), self.board, isEnpassantMove=True))
-            if c+1 <= 7: # Captures to the right
+            if c+1 <= 7 and (pinDirection is None or pinDirection in ((1, 1), (-1, -1))): # Captures to the right
                 if self.board[r+1][c+1][0] == 'w':
-                    moves.append(Move((r, c), (r+1 , c+1), self.board))
+                    self.addPawnMove((r, c), (r+1, c+1), moves)
                 elif (r+1, c+1) == self.enPassantPossible:
                     moves.append(Move((r, c), (r+1, c+1), self.board, isEnpassantMove=True))
+
+    '''
+    Add a pawn move to the list, or one move for every piece the pawn can promote to when it reaches the last rank
+    '''
+    def addPawnMove(self, startSq, endSq, moves):
+        if endSq[0] == 0 or endSq[0] == 7:
+            for piece in Move.promotionPieces:
+                moves.append(Move(startSq, endSq, self.board, promotionPiece=piece))
+        else:
+            moves.append(Move(startSq, endSq, self.board))
+
     '''
     Get all the rook moves for the rook located at row, col and ad these moves to the list
     '''
     def getRookMoves(self, r, c, moves):
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1)) # Up, Left, Down, Right
         enemyColor = 'b' if self.whiteToMove else 'w'
+        pinDirection = self.pins.get((r, c))
         for d in directions:
+            if pinDirection is not None and d != pinDirection and d != (-pinDirection[0], -pinDirection[1]):
+                continue # A pinned rook can only slide along the pin
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8: # On board
                     endPiece = self.board[endRow][endCol]
                     if endPiece == '--': # Empty space valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if not self.capturesOnly:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor: # Enemy piece valid
                         moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
@@ -253,6 +887,8 @@ class GameState():
     Get all the knight moves for the knight located at row, col and ad these moves to the list
     '''
     def getKnightMoves(self, r, c, moves):
+        if (r, c) in self.pins: # A pinned knight can never move
+            return
         knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
         allyColor = 'w' if self.whiteToMove else 'b'
         for m in knightMoves:
@@ -260,7 +896,7 @@ class GameState():
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # Not an ally piece
+                if endPiece[0] != allyColor and (endPiece != '--' or not self.capturesOnly): # Not an ally piece
                     moves.append(Move((r, c), (endRow, endCol), self.board))
 
     '''
@@ -269,14 +905,18 @@ class GameState():
     def getBishopMoves(self, r, c, moves):
         directions = ((-1, -1), (-1, 1), (1, -1), (1, 1)) # 4 diagonals
         enemyColor = 'b' if self.whiteToMove else 'w'
+        pinDirection = self.pins.get((r, c))
         for d in directions:
+            if pinDirection is not None and d != pinDirection and d != (-pinDirection[0], -pinDirection[1]):
+                continue # A pinned bishop can only slide along the pin
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
                     endPiece = self.board[endRow][endCol]
                     if endPiece == '--': # Empty space valid
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                        if not self.capturesOnly:
+                            moves.append(Move((r, c), (endRow, endCol), self.board))
                     elif endPiece[0] == enemyColor: # Enemy piece valid
                         moves.append(Move((r, c), (endRow, endCol), self.board))
                         break
@@ -303,7 +943,7 @@ class GameState():
             endCol = c + kingMoves[i][1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
                 endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor: # Not an ally piece
+                if endPiece[0] != allyColor and (endPiece != '--' or not self.capturesOnly): # Not an ally piece
                     moves.append(Move((r, c), (endRow, endCol), self.board))
 
     '''
@@ -327,7 +967,266 @@ class GameState():
             if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
                 moves.append(Move((r, c), (r, c-2), self.board, isCastleMove=True))
 
+'''
+Read a file of FEN (or EPD) lines one line at a time and yield a GameState for each, so big position files never have to fit in memory.
+Anything after a ';' on a line is left out, blank lines and lines starting with '#' are skipped
+'''
+def readFENFile(path, gameState=GameState):
+    with open(path) as fenFile:
+        for line in fenFile:
+            fen = line.split(';')[0].strip()
+            if fen and not fen.startswith('#'):
+                yield gameState(fen)
+
+'''
+Integer coded version of GameState. The squares are kept in a 10x12 mailbox (a flat list with a 2 square border of OFF_BOARD around the board)
+so the generators can walk with plain index offsets and compare ints instead of slicing strings, with no bounds checks.
+self.board is still kept up to date as the 8x8 list of strings, so ChessMain.drawPieces, GameState.computeScores and Move keep working.
+Pick it at construction with CompactGameState() in place of GameState().
+'''
+EMPTY = 0
+OFF_BOARD = 16
+# White pieces are 1-6 and black pieces 9-14, so the 8 bit is the color
+pieceCodes = {'--': EMPTY, 'wp': 1, 'wN': 2, 'wB': 3, 'wR': 4, 'wQ': 5, 'wK': 6, 'bp': 9, 'bN': 10, 'bB': 11, 'bR': 12, 'bQ': 13, 'bK': 14}
+squareIndex = [[(r + 2) * 10 + c + 1 for c in range(8)] for r in range(8)] # (row, col) to mailbox index
+indexSquare = {squareIndex[r][c]: (r, c) for r in range(8) for c in range(8)} # Mailbox index to (row, col)
+
+class CompactGameState(GameState):
+    # (mailbox offset, row direction, col direction)
+    rookDirections = ((-10, -1, 0), (-1, 0, -1), (10, 1, 0), (1, 0, 1))
+    bishopDirections = ((-11, -1, -1), (-9, -1, 1), (9, 1, -1), (11, 1, 1))
+    knightOffsets = ((-21, -2, -1), (-19, -2, 1), (-12, -1, -2), (-8, -1, 2), (8, 1, -2), (12, 1, 2), (19, 2, -1), (21, 2, 1))
+    kingOffsets = ((-11, -1, -1), (-10, -1, 0), (-9, -1, 1), (-1, 0, -1), (1, 0, 1), (9, 1, -1), (10, 1, 0), (11, 1, 1))
+
+    def __init__(self, fen=None):
+        self.squares = [OFF_BOARD] * 120
+        GameState.__init__(self, fen)
+        self.syncAllSquares()
+        # Move functions by the type part of the piece code
+        self.codeMoveFunctions = [None, self.getPawnMoves, self.getKnightMoves, self.getBishopMoves, self.getRookMoves, self.getQueenMoves, self.getKingMoves]
+
+    '''
+    Rebuild the mailbox from the string board
+    '''
+    def syncAllSquares(self):
+        for r in range(8):
+            for c in range(8):
+                self.squares[squareIndex[r][c]] = pieceCodes[self.board[r][c]]
+
+    '''
+    Copy the squares a move touches from the string board into the mailbox
+    '''
+    def syncSquares(self, move):
+        board = self.board
+        squares = self.squares
+        squares[squareIndex[move.startRow][move.startCol]] = pieceCodes[board[move.startRow][move.startCol]]
+        squares[squareIndex[move.endRow][move.endCol]] = pieceCodes[board[move.endRow][move.endCol]]
+        if move.isEnpassantMove:
+            squares[squareIndex[move.startRow][move.endCol]] = pieceCodes[board[move.startRow][move.endCol]]
+        elif move.isCastleMove:
+            for c in (0, 3, 5, 7): # Rook squares on either side
+                squares[squareIndex[move.endRow][c]] = pieceCodes[board[move.endRow][c]]
+
+    def loadFEN(self, fen):
+        GameState.loadFEN(self, fen)
+        self.syncAllSquares()
+
+    def makeMove(self, move):
+        GameState.makeMove(self, move)
+        self.syncSquares(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            GameState.undoMove(self)
+            self.syncSquares(move)
+
+    def getAllPossibleMoves(self):
+        moves = []
+        squares = self.squares
+        low, high = (1, 6) if self.whiteToMove else (9, 14)
+        for r in range(8):
+            rowIndex = squareIndex[r]
+            for c in range(8):
+                piece = squares[rowIndex[c]]
+                if low <= piece <= high:
+                    self.codeMoveFunctions[piece & 7](r, c, moves)
+        return moves
+
+    def getPawnMoves(self, r, c, moves):
+        squares = self.squares
+        board = self.board
+        i = squareIndex[r][c]
+        pinDirection = self.pins.get((r, c))
+        if self.whiteToMove:
+            dr, startRow, enemyLow, enemyHigh = -1, 6, 9, 14
+        else:
+            dr, startRow, enemyLow, enemyHigh = 1, 1, 1, 6
+        forward = i + dr * 10
+        if squares[forward] == EMPTY and (pinDirection is None or pinDirection[1] == 0) and (not self.capturesOnly or r + dr in (0, 7)): # 1 square pawn advance
+            self.addPawnMove((r, c), (r + dr, c), moves)
+            if r == startRow and squares[forward + dr * 10] == EMPTY and not self.capturesOnly: # 2 square pawn advance
+                moves.append(Move((r, c), (r + 2 * dr, c), board))
+        for dc in (-1, 1): # Captures to the left and right
+            if pinDirection is None or pinDirection == (dr, dc) or pinDirection == (-dr, -dc):
+                target = squares[forward + dc]
+                if enemyLow <= target <= enemyHigh:
+                    self.addPawnMove((r, c), (r + dr, c + dc), moves)
+                elif target == EMPTY and (r + dr, c + dc) == self.enPassantPossible:
+                    moves.append(Move((r, c), (r + dr, c + dc), board, isEnpassantMove=True))
+
+    def getRookMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, moves, self.rookDirections)
+
+    def getBishopMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, moves, self.bishopDirections)
+
+    def getQueenMoves(self, r, c, moves):
+        self.getSlidingMoves(r, c, moves, self.rookDirections)
+        self.getSlidingMoves(r, c, moves, self.bishopDirections)
+
+    def getSlidingMoves(self, r, c, moves, directions):
+        squares = self.squares
+        board = self.board
+        i = squareIndex[r][c]
+        enemyLow, enemyHigh = (9, 14) if self.whiteToMove else (1, 6)
+        pinDirection = self.pins.get((r, c))
+        capturesOnly = self.capturesOnly
+        for offset, dr, dc in directions:
+            if pinDirection is not None and pinDirection != (dr, dc) and pinDirection != (-dr, -dc):
+                continue # A pinned piece can only slide along the pin
+            target = i + offset
+            endRow = r + dr
+            endCol = c + dc
+            while squares[target] == EMPTY:
+                if not capturesOnly:
+                    moves.append(Move((r, c), (endRow, endCol), board))
+                target += offset
+                endRow += dr
+                endCol += dc
+            if enemyLow <= squares[target] <= enemyHigh: # Off the board and allied pieces fall outside the enemy range
+                moves.append(Move((r, c), (endRow, endCol), board))
+
+    def getKnightMoves(self, r, c, moves):
+        if (r, c) in self.pins: # A pinned knight can never move
+            return
+        self.getStepMoves(r, c, moves, self.knightOffsets)
+
+    def getKingMoves(self, r, c, moves):
+        self.getStepMoves(r, c, moves, self.kingOffsets)
+
+    def getStepMoves(self, r, c, moves, offsets):
+        squares = self.squares
+        board = self.board
+        i = squareIndex[r][c]
+        enemyLow, enemyHigh = (9, 14) if self.whiteToMove else (1, 6)
+        for offset, dr, dc in offsets:
+            target = squares[i + offset]
+            if (target == EMPTY and not self.capturesOnly) or enemyLow <= target <= enemyHigh:
+                moves.append(Move((r, c), (r + dr, c + dc), board))
+
+    def checkForPinsAndChecks(self, r, c):
+        pins = {}
+        checks = []
+        inCheck = False
+        squares = self.squares
+        i = squareIndex[r][c]
+        if self.whiteToMove:
+            allyLow, allyHigh = 1, 6
+            pawn, knight, bishop, rook, queen = 9, 10, 11, 12, 13
+            pawnRow = -1
+        else:
+            allyLow, allyHigh = 9, 14
+            pawn, knight, bishop, rook, queen = 1, 2, 3, 4, 5
+            pawnRow = 1
+        for directions, slider in ((self.rookDirections, rook), (self.bishopDirections, bishop)):
+            for offset, dr, dc in directions:
+                possiblePin = ()
+                target = i + offset
+                distance = 1
+                while True:
+                    piece = squares[target]
+                    if piece == EMPTY:
+                        pass
+                    elif allyLow <= piece <= allyHigh:
+                        if possiblePin == ():
+                            possiblePin = (r + dr * distance, c + dc * distance)
+                        else:
+                            break
+                    else:
+                        if piece == slider or piece == queen or (distance == 1 and piece == pawn and dr == pawnRow and slider == bishop):
+                            if possiblePin == ():
+                                inCheck = True
+                                checks.append((r + dr * distance, c + dc * distance, dr, dc))
+                            else:
+                                pins[possiblePin] = (dr, dc)
+                        break # Enemy piece or off the board
+                    target += offset
+                    distance += 1
+        for offset, dr, dc in self.knightOffsets:
+            if squares[i + offset] == knight:
+                inCheck = True
+                checks.append((r + dr, c + dc, dr, dc))
+        return inCheck, pins, checks
+
+    def exposesKing(self, move):
+        squares = self.squares
+        start = squareIndex[move.startRow][move.startCol]
+        end = squareIndex[move.endRow][move.endCol]
+        startPiece = squares[start]
+        endPiece = squares[end]
+        squares[start] = EMPTY
+        squares[end] = startPiece
+        if move.isEnpassantMove:
+            captured = squareIndex[move.startRow][move.endCol]
+            squares[captured] = EMPTY
+        if move.pieceMoved[1] == 'K':
+            kingRow, kingCol = move.endRow, move.endCol
+        elif self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        inCheck = self.squareUnderAttack(kingRow, kingCol)
+        squares[start] = startPiece
+        squares[end] = endPiece
+        if move.isEnpassantMove:
+            squares[captured] = pieceCodes[move.pieceCaptured]
+        return inCheck
+
+    def squareAttackedBy(self, r, c, attackerColor):
+        squares = self.squares
+        i = squareIndex[r][c]
+        if attackerColor == 'w':
+            pawn, knight, bishop, rook, queen, king = 1, 2, 3, 4, 5, 6
+            pawnOffset = 10 # White pawns attack up the board, so they sit on the row below
+        else:
+            pawn, knight, bishop, rook, queen, king = 9, 10, 11, 12, 13, 14
+            pawnOffset = -10
+        if squares[i + pawnOffset - 1] == pawn or squares[i + pawnOffset + 1] == pawn:
+            return True
+        for offset, dr, dc in self.knightOffsets:
+            if squares[i + offset] == knight:
+                return True
+        for offset, dr, dc in self.kingOffsets:
+            if squares[i + offset] == king:
+                return True
+        for offset, dr, dc in self.rookDirections:
+            target = i + offset
+            while squares[target] == EMPTY:
+                target += offset
+            if squares[target] == rook or squares[target] == queen:
+                return True
+        for offset, dr, dc in self.bishopDirections:
+            target = i + offset
+            while squares[target] == EMPTY:
+                target += offset
+            if squares[target] == bishop or squares[target] == queen:
+                return True
+        return False
+
 class CastleRights():
+    __slots__ = ('wks', 'bks', 'wqs', 'bqs')
+
     def __init__(self, wks, bks, wqs, bqs):
         self.wks = wks
         self.bks = bks
@@ -335,30 +1234,62 @@ class CastleRights():
         self.bqs = bqs
 
 class Move():
+    # Moves are created by the thousand and most are thrown away, so they use slots instead of a __dict__ and only look up
+    # the pieces on the board (pieceMoved, pieceCaptured, isPawnPromotion) the first time they are needed
+    __slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'isEnpassantMove', 'isCastleMove', 'promotionPiece', 'moveID', 'board', '_pieceMoved', '_pieceCaptured')
+
     # Map keys to values
     # Key: Value
     ranksToRows = {'1': 7, '2': 6, '3': 5, '4': 4, '5': 3, '6': 2, '7': 1, '8': 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {'a': 0, 'b': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
+    promotionPieces = ('Q', 'R', 'B', 'N')
 
-    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False):
+    def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotionPiece=None):
         self.startRow = startSq[0]
         self.startCol = startSq[1]
         self.endRow = endSq[0]
         self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # Pawn promotion
-        self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+        self.board = board # Only read until the pieces are looked up
+        self._pieceMoved = None
+        self._pieceCaptured = None
         # En passant
         self.isEnpassantMove = isEnpassantMove
-        if isEnpassantMove:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
         # Castle move
         self.isCastleMove = isCastleMove
+        # Pawn promotion, 'Q', 'R', 'B' or 'N'. Each promotion is its own move, so the piece is part of the moveID
+        self.promotionPiece = promotionPiece
 
         self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+        if promotionPiece is not None:
+            self.moveID += (self.promotionPieces.index(promotionPiece) + 1) * 10000
+
+    @property
+    def pieceMoved(self):
+        if self._pieceMoved is None:
+            self._pieceMoved = self.board[self.startRow][self.startCol]
+        return self._pieceMoved
+
+    @property
+    def pieceCaptured(self):
+        if self._pieceCaptured is None:
+            if self.isEnpassantMove:
+                self._pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'
+            else:
+                self._pieceCaptured = self.board[self.endRow][self.endCol]
+        return self._pieceCaptured
+
+    # Pawn promotion
+    @property
+    def isPawnPromotion(self):
+        return (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
+
+    '''
+    Look up the moved and captured pieces while the board still matches the position the move was generated in
+    '''
+    def loadPieces(self):
+        return self.pieceMoved, self.pieceCaptured
 
     '''
     Overriding the equals method
@@ -368,8 +1299,14 @@ class Move():
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
-        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        notation = self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+        if self.promotionPiece is not None:
+            notation += self.promotionPiece.lower()
+        return notation
     
     def getRankFile(self, r, c):
         return self.colsToFiles[c] + self.rowsToRanks[r]
\ No newline at end of file
@@ -1,6 +1,10 @@
 '''
 Main driver file. Responsible for handling user input and displaying current GameState object.
 '''
+import copy
+import queue
+import threading
+import time
 import pygame as p
 import ChessEngine, SmartMoveFinder
 
@@ -9,19 +13,39 @@ DIMENSION = 8 # 8x8 chess board
 SQ_SIZE = HEIGHT // DIMENSION
 MAX_FPS = 15 # For animations
 IMAGES = {}
+colors = [p.Color('white'), p.Color('gray')]
+boardImage = None # The empty board, drawn once in loadImages
+highlightImages = {} # Transparent squares for the selected piece and its moves
+textFont = None
+textImages = {} # Rendered game over messages
+drawnSquares = {} # (row, col) -> (piece, highlight) that is on the screen now, only squares that change are drawn again
+drawnText = None # Game over message on the screen now
+frameTimes = [] # Seconds spent drawing each frame that had something to draw
+skippedFrames = 0 # Frames where nothing changed, so nothing was drawn
 
 '''
-Initialize a global directionary of images. This will only be called once.
+Initialize a global directionary of images, the empty board and the highlights. This will only be called once, after the display is set up.
 '''
 def loadImages():
+    global boardImage
     pieces = ['wp', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bp', 'bR', 'bN', 'bB', 'bQ', 'bK']
     for piece in pieces:
-        IMAGES[piece] = p.transform.scale(p.image.load('images/' + piece + '.png'), (SQ_SIZE, SQ_SIZE)) # You can access an image by saying 'IMAGES['wp']'
+        IMAGES[piece] = p.transform.scale(p.image.load('images/' + piece + '.png'), (SQ_SIZE, SQ_SIZE)).convert_alpha() # You can access an image by saying 'IMAGES['wp']'
+    boardImage = p.Surface((WIDTH, HEIGHT)).convert()
+    for r in range(DIMENSION):
+        for c in range(DIMENSION):
+            p.draw.rect(boardImage, colors[((r+c) % 2)], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    for color in ('blue', 'yellow'):
+        s = p.Surface((SQ_SIZE, SQ_SIZE)).convert()
+        s.set_alpha(100) # Transparency value -> 0 transparent: 255 opaque
+        s.fill(p.Color(color))
+        highlightImages[color] = s
 
 '''
 The main driver for the code. This will handle user input and updating the graphics
 '''
 def main():
+    global skippedFrames
     p.init()
     screen = p.display.set_mode((WIDTH, HEIGHT))
     clock = p.time.Clock()
@@ -30,21 +54,33 @@ def main():
     validMoves = gs.getValidMoves()
     moveMade = False # Flag variable for when a move is made
     animate = False # Flag variable for when we should animate a move
+    redraw = True # Something on the board may have changed, idle frames skip drawing altogether while this is False
     loadImages() # Only do this once, before the while loop
+    SmartMoveFinder.loadOpeningBook() # Used if there is a book file, see OpeningBook.py
     running = True
     sqSelected = () # No square is selected, keep track of the last user click (tuple: (row, col))
     playerClicks = [] # Keep track of player clicks (two tuples: [(6,4), (4, 4)])
     gameOver = False
     playerOne = True # If a Human is playing white, then this will be True. If an AI is playing white, this will be False
     playerTwo = False # If a Human is playing black, then this will be True. If an AI is playing white, this will be True. Set both values to False for the AI to play itself
+    AIThinking = False # True while the AI's search thread is running
+    moveFinderThread = None
+    stopSearch = None # Event that tells the search thread to stop early
+    returnQueue = None # The search thread puts its move here
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
+                if AIThinking:
+                    stopSearch.set()
             # Mouse handler
+            elif e.type in (p.WINDOWEXPOSED, p.VIDEOEXPOSE): # The window was covered or restored, draw every square again
+                drawnSquares.clear()
+                redraw = True
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and humanTurn:
+                    redraw = True
                     location = p.mouse.get_pos() # (x, y) location of the mouse cursor
                     col = location[0]//SQ_SIZE
                     row = location[1]//SQ_SIZE
@@ -55,141 +91,253 @@ def main():
                         sqSelected = (row, col)
                         playerClicks.append(sqSelected) # Append for 1st and 2nd clicks
                     if len(playerClicks) == 2: # After the 2nd click
-                        move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
-                        print(move.getChessNotation())
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                gs.makeMove(move)
-                                moveMade = True
-                                animate = True
-                                sqSelected = () # Reset user clicks
-                                playerClicks = []
-                        if not moveMade:
+                        # Every valid move between the 2 squares, there is one per piece for a pawn promotion
+                        matchingMoves = [validMove for validMove in validMoves if (validMove.startRow, validMove.startCol) == playerClicks[0] and (validMove.endRow, validMove.endCol) == playerClicks[1]]
+                        move = None
+                        if len(matchingMoves) == 1:
+                            move = matchingMoves[0]
+                        elif len(matchingMoves) > 1:
+                            move = choosePromotion(screen, clock, matchingMoves)
+                        if move is not None:
+                            print(move.getChessNotation())
+                            gs.makeMove(move) # The generated move, so castling, en passant and promotion are played properly
+                            moveMade = True
+                            animate = True
+                            sqSelected = () # Reset user clicks
+                            playerClicks = []
+                        elif len(matchingMoves) > 1: # Promotion cancelled
+                            sqSelected = ()
+                            playerClicks = []
+                        else:
                             playerClicks = [sqSelected]
             # Key handlers
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # Undo when 'z' is pressed
+                    if AIThinking: # Abort the search, it is for a position we are leaving
+                        cancelAIMove(moveFinderThread, stopSearch)
+                        AIThinking = False
                     gs.undoMove()
+                    redraw = True
                     moveMade = True
                     animate = False
+                    gameOver = False
                 if e.key == p.K_r: # Reset the board when 'r' is pressed
+                    if AIThinking:
+                        cancelAIMove(moveFinderThread, stopSearch)
+                        AIThinking = False
                     gs = ChessEngine.GameState()
-                    validMove = gs.getValidMoves()
+                    validMoves = gs.getValidMoves()
+                    SmartMoveFinder.transpositionTable.clear() # Nothing from the last game carries over
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     animate = False
+                    gameOver = False
+                    redraw = True
 
-        # AI move finder
-        if not gameOver and not humanTurn:
-            AIMove = SmartMoveFinder.findBestMove(gs, validMoves)
-            if AIMove is None:
-                AIMove = SmartMoveFinder.findRandomMove(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
-            animate = True
+        # AI move finder. The search runs in its own thread on a copy of the game, the loop keeps drawing and checks for the move every frame
+        humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo) # Again, an undo or reset may have changed the side to move
+        if not gameOver and not humanTurn and running:
+            if not AIThinking:
+                AIThinking = True
+                stopSearch = threading.Event()
+                returnQueue = queue.Queue()
+                moveFinderThread = threading.Thread(target=findAIMove, args=(copy.deepcopy(gs), returnQueue, stopSearch), daemon=True)
+                moveFinderThread.start()
+            if not moveFinderThread.is_alive(): # Done searching
+                try:
+                    searchKey, AIMove = returnQueue.get_nowait()
+                except queue.Empty: # The thread died without a move
+                    searchKey, AIMove = gs.zobristKey, SmartMoveFinder.findRandomMove(validMoves)
+                if searchKey == gs.zobristKey and AIMove in validMoves: # Otherwise it is for a position we left, the next frame searches again
+                    gs.makeMove(validMoves[validMoves.index(AIMove)]) # Same move, but generated from our GameState rather than the copy
+                    moveMade = True
+                    animate = True
+                AIThinking = False
 
         if moveMade:
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                animateMove(gs.moveLog[-1], screen, gs, clock)
             validMoves = gs.getValidMoves()
             moveMade = False
             animate = False
+            redraw = True
 
-        drawGameState(screen, gs, validMoves, sqSelected)
-
+        text = None
         if gs.checkmate:
             gameOver = True
-            if gs.whiteToMove:
-                drawText(screen, 'Black wins by checkmate')
-            else:
-                drawText(screen, 'White wins by checkmate')
+            text = 'Black wins by checkmate' if gs.whiteToMove else 'White wins by checkmate'
         elif gs.stalemate:
             gameOver = True
-            drawText(screen, 'Stalemate')
+            text = 'Stalemate'
+
+        if redraw:
+            frameStart = time.perf_counter()
+            dirtyRects = drawGameState(screen, gs, validMoves, sqSelected, text)
+            if dirtyRects: # Only the squares that changed go to the display
+                p.display.update(dirtyRects)
+            frameTimes.append(time.perf_counter() - frameStart)
+            redraw = False
+        else: # Nothing happened since the last frame, nothing is drawn or even compared
+            skippedFrames += 1
 
         clock.tick(MAX_FPS)
-        p.display.flip()
+    printFrameStats()
 
 '''
-Highlight square selected and moves for piece selected
+Runs in the AI's thread with its own copy of the GameState. Puts (the position's Zobrist key, the move it finds) in returnQueue, a random move if
+the search fails
+'''
+def findAIMove(gs, returnQueue, stopEvent):
+    validMoves = gs.getValidMoves()
+    AIMove = None
+    try:
+        AIMove = SmartMoveFinder.findBookMove(gs, validMoves)
+        if AIMove is None:
+            AIMove = SmartMoveFinder.findBestMove(gs, validMoves, stopEvent=stopEvent)
+    finally: # The main loop waits for a move, so one goes on the queue even if the search raised
+        if AIMove is None:
+            AIMove = SmartMoveFinder.findRandomMove(validMoves)
+        returnQueue.put((gs.zobristKey, AIMove))
+
 '''
-def highlightSquares(screen, gs, validMoves, sqSelected):
+Stop the AI's search and wait for its thread to finish, it stops at the next position it looks at
+'''
+def cancelAIMove(moveFinderThread, stopEvent):
+    stopEvent.set()
+    moveFinderThread.join()
+
+'''
+Let the player pick the piece to promote to. The choices are drawn in a column from the promotion square and the game waits for a click
+on one of them. Clicking anywhere else (or closing the window) cancels the move and returns None
+'''
+def choosePromotion(screen, clock, promotionMoves):
+    move = promotionMoves[0]
+    direction = 1 if move.endRow == 0 else -1 # Down the board from white's last rank, up from black's
+    choices = {}
+    rects = []
+    for i in range(len(promotionMoves)):
+        r = move.endRow + direction * i
+        square = p.Rect(move.endCol*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        p.draw.rect(screen, p.Color('light blue'), square)
+        screen.blit(IMAGES[move.pieceMoved[0] + promotionMoves[i].promotionPiece], square)
+        choices[(r, move.endCol)] = promotionMoves[i]
+        drawnSquares.pop((r, move.endCol), None) # Drawn over, so the next frame puts the square back
+        rects.append(square)
+    p.display.update(rects)
+    while True:
+        for e in p.event.get():
+            if e.type == p.QUIT:
+                p.event.post(e) # Let the main loop quit
+                return None
+            elif e.type == p.MOUSEBUTTONDOWN:
+                location = e.pos # (x, y) location of the click
+                return choices.get((location[1]//SQ_SIZE, location[0]//SQ_SIZE))
+        clock.tick(MAX_FPS)
+
+'''
+Squares to highlight for the piece selected, (row, col) -> 'blue' for the selected square and 'yellow' for its moves
+'''
+def getHighlights(gs, validMoves, sqSelected):
+    highlights = {}
     if sqSelected != ():
         r, c = sqSelected
         if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'): # sqSelected is a piece that can be moved
-            # Highlight selected square
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100) # Transparency value -> 0 transparent: 255 opaque
-            s.fill(p.Color('blue'))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
-            # Highlight moves from that square
-            s.fill(p.Color('yellow'))
+            highlights[(r, c)] = 'blue'
             for move in validMoves:
                 if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (move.endCol*SQ_SIZE, move.endRow*SQ_SIZE))
-
-'''
-Responsible for graphics within a current game state.
-'''
-def drawGameState(screen, gs, validMoves, sqSelected):
-    drawBoard(screen) # Draw squares on the board
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board) # Draw pieces on the squares
+                    highlights[(move.endRow, move.endCol)] = 'yellow'
+    return highlights
 
 '''
-Draw the squares on the board.
+Responsible for graphics within a current game state. Only squares whose piece or highlight changed since they were last drawn are drawn
+again. Returns the rects that changed, for p.display.update, and an empty list when the screen is already up to date
 '''
-def drawBoard(screen):
-    global colors
-    colors = [p.Color('white'), p.Color('gray')]
+def drawGameState(screen, gs, validMoves, sqSelected, text=None):
+    global drawnText
+    if text != drawnText: # The text lies across squares, draw them all again under the new text
+        drawnSquares.clear()
+        drawnText = text
+    highlights = getHighlights(gs, validMoves, sqSelected)
+    dirtyRects = []
     for r in range(DIMENSION):
         for c in range(DIMENSION):
-            color = colors[((r+c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+            square = (gs.board[r][c], highlights.get((r, c)))
+            if drawnSquares.get((r, c)) != square:
+                dirtyRects.append(drawSquare(screen, r, c, square[0], square[1]))
+                drawnSquares[(r, c)] = square
+    if dirtyRects and text is not None:
+        dirtyRects.append(drawText(screen, text))
+    return dirtyRects
 
 '''
-Draws the pieces on the board using the current GameState.board
+Draw one square from the board image, with its highlight and piece on top. Returns the square's rect
 '''
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != '--': # Not an empty square
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+def drawSquare(screen, r, c, piece, highlight=None):
+    square = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+    screen.blit(boardImage, square, square)
+    if highlight is not None:
+        screen.blit(highlightImages[highlight], square)
+    if piece != '--': # Not an empty square
+        screen.blit(IMAGES[piece], square)
+    return square
 
 '''
-Animating a move
+Animating a move. The board is drawn once with the end square emptied, then each frame only puts back what was under the piece's
+last position and draws it at the next one
 '''
-def animateMove(move, screen, board, clock):
-    global colors
+def animateMove(move, screen, gs, clock):
     dR = move.endRow - move.startRow
     dC = move.endCol - move.startCol
     framesPerSquare = 10 # Frames to move one square
     frameCount = (abs(dR) + abs(dC)) * framesPerSquare
+    rects = drawGameState(screen, gs, [], ())
+    # Erase the piece moved from its ending square and draw the captured piece there
+    rects.append(drawSquare(screen, move.endRow, move.endCol, move.pieceCaptured))
+    drawnSquares.pop((move.endRow, move.endCol), None) # The next frame draws the piece moved back on it
+    p.display.update(rects)
+    background = screen.copy()
+    pieceRect = None
     for frame in range(frameCount + 1):
+        frameStart = time.perf_counter()
         r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        # Erase the piece moved from its ending square
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        # Draw captured piece onto rectangle
-        if move.pieceCaptured != '--':
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
+        newRect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+        rects = [newRect]
+        if pieceRect is not None:
+            screen.blit(background, pieceRect, pieceRect)
+            rects.append(pieceRect)
         # Draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
+        screen.blit(IMAGES[move.pieceMoved], newRect)
+        p.display.update(rects)
+        frameTimes.append(time.perf_counter() - frameStart)
+        pieceRect = newRect
         clock.tick(60)
 
+'''
+Draw the game over message in the middle of the board, the font and the rendered text are kept so it is only rendered once. Returns its rect
+'''
 def drawText(screen, text):
-    font = p.font.SysFont('Helvetica', 32, True, False)
-    textObject = font.render(text, 0, p.Color('Gray'))
+    global textFont
+    if text not in textImages:
+        if textFont is None:
+            textFont = p.font.SysFont('Helvetica', 32, True, False)
+        textImages[text] = (textFont.render(text, 0, p.Color('Gray')), textFont.render(text, 0, p.Color('Black')))
+    shadow, textObject = textImages[text]
     textLocation = p.Rect(0, 0, WIDTH, HEIGHT).move(WIDTH/2 - textObject.get_width()/2, HEIGHT/2 - textObject.get_height()/2)
-    screen.blit(textObject, textLocation)
-    textObject = font.render(text, 0, p.Color('Black'))
+    screen.blit(shadow, textLocation)
     screen.blit(textObject, textLocation.move(2, 2))
+    return p.Rect(textLocation.x, textLocation.y, textObject.get_width() + 2, textObject.get_height() + 2)
+
+'''
+Print how long the frames took to draw, called when the window closes
+'''
+def printFrameStats():
+    if not frameTimes:
+        return
+    times = sorted(frameTimes)
+    print(str(len(times)) + ' frames drawn, ' + str(skippedFrames) + ' idle frames skipped, frame time avg ' +
+          format(sum(times) / len(times) * 1000, '.2f') + 'ms p95 ' + format(times[int(len(times) * 0.95)] * 1000, '.2f') + 'ms max ' +
+          format(times[-1] * 1000, '.2f') + 'ms')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
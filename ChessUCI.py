@@ -0,0 +1,181 @@
+'''
+UCI (Universal Chess Interface) front end, so the engine can be run by chess GUIs and tournament managers without the pygame client.
+    python ChessUCI.py
+Reads commands on stdin and answers on stdout. The search runs in its own thread so stop (and quit) are read while it is thinking.
+Supported: uci, isready, ucinewgame, setoption name Hash/Profile/TraceFile, position startpos/fen ... moves ..., go depth/movetime/wtime/btime/winc/binc/
+movestogo/nodes/infinite, stop, quit
+'''
+import sys
+import threading
+import time
+import ChessEngine
+import Profiler
+import SmartMoveFinder
+import TranspositionTable
+
+ENGINE_NAME = 'lowEloEngine'
+ENGINE_AUTHOR = 'Angus-Developer'
+MAX_DEPTH = 64 # Depth for searches that are only limited by time, nodes or stop
+MOVES_TO_GO = 30 # Moves the remaining time is split over when the GUI doesn't say
+PROFILE_LOG_INTERVAL = 10 # Seconds between the profiler's info string lines
+
+class UCIEngine():
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock() # The search thread prints info and bestmove while the reader thread answers other commands
+        self.gs = ChessEngine.GameState()
+        self.searchThread = None
+        self.stopEvent = threading.Event()
+        self.traceFile = None # Written when profiling is turned off or the engine quits
+        SmartMoveFinder.loadOpeningBook()
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    '''
+    Handle one command line. Returns False on quit. A command that can't be carried out is reported with info string
+    '''
+    def handleCommand(self, line):
+        words = line.split()
+        if not words:
+            return True
+        try:
+            command = words[0]
+            if command == 'uci':
+                self.send('id name ' + ENGINE_NAME)
+                self.send('id author ' + ENGINE_AUTHOR)
+                self.send('option name Hash type spin default ' + str(SmartMoveFinder.HASH_SIZE) + ' min 1 max 1024')
+                self.send('option name Profile type check default false')
+                self.send('option name TraceFile type string default <empty>')
+                self.send('uciok')
+            elif command == 'isready':
+                self.send('readyok')
+            elif command == 'ucinewgame':
+                self.stopSearch()
+                SmartMoveFinder.transpositionTable.clear()
+                self.gs = ChessEngine.GameState()
+            elif command == 'setoption':
+                self.setOption(words)
+            elif command == 'position':
+                self.stopSearch()
+                self.setPosition(words)
+            elif command == 'go':
+                self.stopSearch()
+                self.go(words)
+            elif command == 'stop':
+                self.stopSearch()
+            elif command == 'quit':
+                self.stopSearch()
+                Profiler.disable()
+                return False
+        except ValueError as error: # A bad move, FEN or number, the GUI is told and the engine keeps going
+            self.send('info string ' + str(error))
+        return True
+
+    def setOption(self, words):
+        if 'name' in words and 'value' in words:
+            name = ' '.join(words[words.index('name') + 1:words.index('value')])
+            value = ' '.join(words[words.index('value') + 1:])
+            if name.lower() == 'hash':
+                self.stopSearch()
+                SmartMoveFinder.transpositionTable = TranspositionTable.TranspositionTable(max(1, int(value)))
+            elif name.lower() == 'profile':
+                self.stopSearch()
+                if value.lower() == 'true':
+                    Profiler.enable(self.traceFile, PROFILE_LOG_INTERVAL, lambda line: self.send('info string ' + line))
+                elif Profiler.enabled:
+                    Profiler.disable()
+                    for line in Profiler.formatStats().split('\n'):
+                        self.send('info string ' + line)
+            elif name.lower() == 'tracefile':
+                self.traceFile = value if value and value != '<empty>' else None
+
+    '''
+    position startpos [moves ...] or position fen <fen> [moves ...]
+    '''
+    def setPosition(self, words):
+        movesAt = words.index('moves') if 'moves' in words else len(words)
+        if len(words) > 1 and words[1] == 'fen':
+            gs = ChessEngine.GameState(' '.join(words[2:movesAt]))
+        else:
+            gs = ChessEngine.GameState()
+        for text in words[movesAt + 1:]:
+            gs.makeMove(gs.parseMove(text))
+        self.gs = gs # Only once it all reads, a bad position leaves the last one
+
+    '''
+    Start searching the current position with the limits given, the best move is sent when the search thread finishes
+    '''
+    def go(self, words):
+        limits = {}
+        for i in range(1, len(words) - 1):
+            if words[i] in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'nodes'):
+                limits[words[i]] = int(words[i + 1])
+        depth = limits.get('depth', MAX_DEPTH)
+        if 'movetime' in limits:
+            timeLimit = limits['movetime'] / 1000
+        elif ('wtime' if self.gs.whiteToMove else 'btime') in limits:
+            remaining = limits['wtime' if self.gs.whiteToMove else 'btime'] / 1000
+            increment = limits.get('winc' if self.gs.whiteToMove else 'binc', 0) / 1000
+            timeLimit = min(remaining / limits.get('movestogo', MOVES_TO_GO) + increment * 0.8, remaining * 0.5)
+        elif 'infinite' in words or 'depth' in limits or 'nodes' in limits:
+            timeLimit = float('inf')
+        else:
+            depth, timeLimit = SmartMoveFinder.DEPTH, SmartMoveFinder.TIME_LIMIT
+        self.stopEvent = threading.Event()
+        # The search gets its own copy of the game, the next position command replaces self.gs
+        self.searchThread = threading.Thread(target=self.search, args=(ChessEngine.GameState(self.gs.getFEN()), depth, timeLimit,
+                                                                        limits.get('nodes'), 'infinite' in words, self.stopEvent), daemon=True)
+        self.searchThread.start()
+
+    def search(self, gs, depth, timeLimit, nodeLimit, infinite, stopEvent):
+        validMoves = gs.getValidMoves()
+        if len(validMoves) == 0:
+            self.send('bestmove 0000')
+            return
+        startTime = time.perf_counter()
+
+        def sendInfo(currentDepth, score, move):
+            elapsed = time.perf_counter() - startTime
+            pv = SmartMoveFinder.getPrincipalVariation(gs, move, currentDepth)
+            self.send('info depth ' + str(currentDepth) + ' score ' + formatScore(score) + ' nodes ' + str(SmartMoveFinder.nodesSearched) +
+                      ' nps ' + str(int(SmartMoveFinder.nodesSearched / max(elapsed, 1e-6))) + ' time ' + str(int(elapsed * 1000)) +
+                      ' pv ' + ' '.join(pvMove.getChessNotation() for pvMove in pv))
+
+        bestMove = SmartMoveFinder.findBookMove(gs, validMoves)
+        if bestMove is None:
+            bestMove = SmartMoveFinder.findBestMove(gs, validMoves, depth, timeLimit, stopEvent, nodeLimit, sendInfo)
+        if bestMove is None: # Stopped before the first move was searched
+            bestMove = validMoves[0]
+        if infinite: # go infinite only gets its answer after stop, even when the search finished on its own
+            stopEvent.wait()
+        self.send('bestmove ' + bestMove.getChessNotation())
+
+    '''
+    Stop the search if one is running and wait for it to send its best move
+    '''
+    def stopSearch(self):
+        if self.searchThread is not None:
+            self.stopEvent.set()
+            self.searchThread.join()
+            self.searchThread = None
+
+'''
+A search score as UCI wants it, centipawns or moves to mate (negative when the engine is getting mated)
+'''
+def formatScore(score):
+    if abs(score) > SmartMoveFinder.MATE_BOUND:
+        plies = SmartMoveFinder.CHECKMATE - abs(score)
+        return 'mate ' + str((plies + 1) // 2 if score > 0 else -(plies // 2))
+    return 'cp ' + str(score)
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handleCommand(line.strip()):
+            break
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+'''
+Endgame tables. For every position of a small set of pieces (3 or 4 with the kings, no pawns) the table holds how many plies it takes to mate,
+worked out backwards from the checkmates (retrograde analysis) with ChessEngine's own move generation. Tables are generated locally with
+    python EndgameTables.py                   the 3 piece tables
+    python EndgameTables.py KQvKR KBNvK       the tables for that material (and any they capture down into)
+    python EndgameTables.py --four            every 4 piece table, takes a long time
+and written to TABLE_DIR as one signed byte per position, which probe() memory maps and reads with a single index per lookup.
+A byte is 0 for a draw, plies to mate + 1 when the side to move wins and -(plies to mate + 1) when it gets mated.
+'''
+import argparse
+import mmap
+import os
+import time
+from array import array
+import ChessEngine
+
+TABLE_DIR = 'tablebases'
+MAGIC = b'LETB0001'
+MAX_PIECES = 4
+THREE_PIECE = ['KQvK', 'KRvK']
+FOUR_PIECE = ['KQQvK', 'KQRvK', 'KQBvK', 'KQNvK', 'KRRvK', 'KRBvK', 'KRNvK', 'KBBvK', 'KBNvK', 'KNNvK',
+              'KQvKQ', 'KQvKR', 'KQvKB', 'KQvKN', 'KRvKR', 'KRvKB', 'KRvKN', 'KBvKB', 'KBvKN', 'KNvKN']
+DRAWN_MATERIAL = ('KvK', 'KBvK', 'KNvK') # Nobody can mate, so there is no table
+pieceOrder = 'KQRBN' # Order of the pieces in a signature, and of their squares in a table index
+
+# Squares are row * 8 + col like the Zobrist keys. The 8 ways to turn and flip the board, as (x, y) with x the file and y the rank from white
+symmetries = [lambda x, y: (x, y), lambda x, y: (7 - x, y), lambda x, y: (x, 7 - y), lambda x, y: (7 - x, 7 - y),
+              lambda x, y: (y, x), lambda x, y: (7 - y, x), lambda x, y: (y, 7 - x), lambda x, y: (7 - y, 7 - x)]
+transformSquare = []
+for symmetry in symmetries:
+    transform = []
+    for square in range(64):
+        x, y = symmetry(square % 8, 7 - square // 8)
+        transform.append((7 - y) * 8 + x)
+    transformSquare.append(transform)
+# Without pawns every position can be turned so the white king is in the a1-d1-d4 triangle, which makes the tables 64 / 10 times smaller
+kingSlots = {}
+for x in range(4):
+    for y in range(x + 1):
+        kingSlots[(7 - y) * 8 + x] = len(kingSlots)
+slotSquares = list(kingSlots)
+kingTransforms = [[g for g in range(8) if transformSquare[g][square] in kingSlots] for square in range(64)]
+
+'''
+The pieces of a signature like 'KQvKR', in the order their squares go in a table index: the white king first, then the rest
+'''
+def signaturePieces(signature):
+    white, black = signature.split('v')
+    return ['w' + piece for piece in white] + ['b' + piece for piece in black]
+
+'''
+Signature for a list of pieces ('wQ', 'bK'...). Returns (signature, colorsSwapped): the side with more material is always white in a table,
+so a position where black has it is looked up with the colors swapped
+'''
+def materialSignature(pieces):
+    white = ''.join(sorted((piece[1] for piece in pieces if piece[0] == 'w'), key=pieceOrder.index))
+    black = ''.join(sorted((piece[1] for piece in pieces if piece[0] == 'b'), key=pieceOrder.index))
+    # More pieces is more material, for the same number the first stronger piece decides
+    if (len(black), [-pieceOrder.index(piece) for piece in black]) > (len(white), [-pieceOrder.index(piece) for piece in white]):
+        return black + 'v' + white, True
+    return white + 'v' + black, False
+
+class EndgameTable():
+    def __init__(self, signature, values=None):
+        self.signature = signature
+        self.pieces = signaturePieces(signature)
+        self.sideSize = len(kingSlots) * 64 ** (len(self.pieces) - 1) # Positions with one side to move
+        self.size = 2 * self.sideSize
+        self.values = values
+
+    '''
+    Open a generated table file, the values are read straight from the memory map
+    '''
+    @classmethod
+    def load(cls, signature, directory=TABLE_DIR):
+        table = cls(signature)
+        table.tableFile = open(os.path.join(directory, signature + '.tb'), 'rb')
+        table.data = mmap.mmap(table.tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if table.data[:len(MAGIC)] != MAGIC or len(table.data) != len(MAGIC) + table.size:
+            table.close()
+            raise ValueError('Not an endgame table for ' + signature)
+        table.values = memoryview(table.data)[len(MAGIC):].cast('b')
+        return table
+
+    def save(self, directory=TABLE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, self.signature + '.tb'), 'wb') as tableFile:
+            tableFile.write(MAGIC)
+            tableFile.write(bytes(self.values))
+
+    def close(self):
+        if hasattr(self, 'data'):
+            self.values.release() # The map can't close while a view of it is around
+            self.data.close()
+            self.tableFile.close()
+
+    '''
+    Table index of the pieces on squares (in the order of self.pieces). The board is turned so the white king is in the triangle,
+    when that can be done 2 ways (the king is on the diagonal) the smaller index is used
+    '''
+    def index(self, squares, whiteToMove):
+        best = None
+        for g in kingTransforms[squares[0]]:
+            transform = transformSquare[g]
+            index = kingSlots[transform[squares[0]]]
+            for square in squares[1:]:
+                index = index * 64 + transform[square]
+            if best is None or index < best:
+                best = index
+        return best if whiteToMove else best + self.sideSize
+
+    '''
+    The squares and side to move for an index, the opposite of self.index
+    '''
+    def squares(self, index):
+        whiteToMove = index < self.sideSize
+        index %= self.sideSize
+        squares = []
+        for i in range(len(self.pieces) - 1):
+            squares.append(index % 64)
+            index //= 64
+        squares.append(slotSquares[index])
+        squares.reverse()
+        return squares, whiteToMove
+
+    '''
+    (result, plies) for a value: result is 1 when the side to move mates in plies, -1 when it gets mated in plies and 0 for a draw
+    '''
+    def result(self, index):
+        value = self.values[index]
+        if value > 0:
+            return 1, value - 1
+        if value < 0:
+            return -1, -value - 1
+        return 0, 0
+
+'''
+Loaded tables by signature, None for the ones that haven't been generated
+'''
+loadedTables = {}
+
+def getTable(signature, directory=TABLE_DIR):
+    if signature not in loadedTables:
+        try:
+            loadedTables[signature] = EndgameTable.load(signature, directory)
+        except FileNotFoundError:
+            loadedTables[signature] = None
+    return loadedTables[signature]
+
+'''
+Look up a list of (piece, square) with whiteToMove in the tables. Returns (result, plies) like EndgameTable.result, or None when there is no
+table for the material
+'''
+def probePieces(pieces, whiteToMove, directory=TABLE_DIR):
+    pieces = list(pieces)
+    signature, colorsSwapped = materialSignature([piece for piece, square in pieces])
+    if signature in DRAWN_MATERIAL:
+        return 0, 0
+    table = getTable(signature, directory)
+    if table is None:
+        return None
+    if colorsSwapped: # Swap the colors and flip the board top to bottom
+        pieces = [(('b' if piece[0] == 'w' else 'w') + piece[1], (7 - square // 8) * 8 + square % 8) for piece, square in pieces]
+        whiteToMove = not whiteToMove
+    squares = []
+    for tablePiece in table.pieces:
+        for i in range(len(pieces)):
+            if pieces[i][0] == tablePiece:
+                squares.append(pieces.pop(i)[1])
+                break
+    return table.result(table.index(squares, whiteToMove))
+
+'''
+Look up a game position. None when it has more than MAX_PIECES pieces, pawns or castle rights, or no table was generated for the material
+'''
+def probe(gs, directory=TABLE_DIR):
+    castleRights = gs.currentCastlingRight
+    if gs.pieceCount > MAX_PIECES or castleRights.wks or castleRights.bks or castleRights.wqs or castleRights.bqs:
+        return None
+    pieces = []
+    for r in range(8):
+        for c in range(8):
+            piece = gs.board[r][c]
+            if piece != '--':
+                if piece[1] == 'p':
+                    return None
+                pieces.append((piece, r * 8 + c))
+    return probePieces(pieces, gs.whiteToMove, directory)
+
+'''
+Generate the table for a signature, and first any table a capture leads to that isn't there yet. Prints progress when verbose
+'''
+def generateTable(signature, directory=TABLE_DIR, verbose=True):
+    startTime = time.perf_counter()
+    table = EndgameTable(signature, bytearray(EndgameTable(signature).size))
+    pieces = table.pieces
+    for i in range(len(pieces)): # Tables for the material left after each capture
+        subSignature = materialSignature(pieces[:i] + pieces[i + 1:])[0]
+        if pieces[i][1] != 'K' and subSignature not in DRAWN_MATERIAL and getTable(subSignature, directory) is None:
+            generateTable(subSignature, directory, verbose)
+    values = [0] * table.size # Plain list while generating, it is much faster to index than the bytearray
+    legal = bytearray(table.size)
+    remaining = bytearray(table.size) # Successors of a position that aren't known to be wins for the other side yet
+    frontier = [[]] # frontier[plies]: positions whose value was found at that distance from mate
+    seeds = [[]] # seeds[plies]: (index, isWin) for captures into another table, applied when that distance is reached
+    gs = ChessEngine.GameState('8/8/8/8/8/8/8/8 w - - 0 1')
+
+    # Forward pass, find the legal positions, the checkmates and how many successors every position has
+    for index in range(table.size):
+        squares, whiteToMove = table.squares(index)
+        if len(set(squares)) != len(squares) or table.index(squares, whiteToMove) != index:
+            continue # Two pieces on a square, or the same position as a smaller index
+        setUpBoard(gs, pieces, squares, whiteToMove)
+        gs.whiteToMove = not whiteToMove
+        if gs.inCheck(): # The side that just moved left its king in check
+            clearBoard(gs, squares)
+            continue
+        gs.whiteToMove = whiteToMove
+        legal[index] = 1
+        moves = gs.getValidMoves()
+        if len(moves) == 0:
+            if gs.inCheck():
+                values[index] = -1
+                frontier[0].append(index)
+            clearBoard(gs, squares)
+            continue
+        successors = set()
+        for move in moves:
+            start = move.startRow * 8 + move.startCol
+            end = move.endRow * 8 + move.endCol
+            if move.pieceCaptured == '--':
+                successors.add(table.index([end if square == start else square for square in squares], not whiteToMove))
+                continue
+            # A capture leaves the table, its value is already known from the smaller one
+            remaining[index] += 1
+            result = probePieces([(pieces[i], end if squares[i] == start else squares[i]) for i in range(len(pieces)) if squares[i] != end],
+                                 not whiteToMove, directory)
+            if result is not None and result[0] != 0:
+                plies = result[1]
+                while len(seeds) <= plies:
+                    seeds.append([])
+                seeds[plies].append((index, result[0] < 0)) # The other side getting mated is a win for this one
+        remaining[index] += len(successors)
+        clearBoard(gs, squares)
+
+    # Backward pass, a position is won in plies + 1 when one successor is lost in plies, and lost in plies + 1 when every successor is won
+    # and the slowest of them is won in plies. The positions a value reaches are found by taking moves back on the board
+    plies = 0
+    while plies < len(seeds) or (plies < len(frontier) and frontier[plies]):
+        while len(frontier) <= plies + 1:
+            frontier.append([])
+        for index, isWin in (seeds[plies] if plies < len(seeds) else []):
+            updatePredecessor(values, remaining, frontier, index, isWin, plies)
+        for index in frontier[plies]:
+            squares, whiteToMove = table.squares(index)
+            setUpBoard(gs, pieces, squares, whiteToMove)
+            gs.whiteToMove = not whiteToMove # Moves of the side that moved into this position
+            predecessors = set()
+            for move in gs.getAllPossibleMoves():
+                if move.pieceCaptured == '--': # Captures came from a bigger table
+                    start = move.startRow * 8 + move.startCol
+                    end = move.endRow * 8 + move.endCol
+                    predecessor = table.index([end if square == start else square for square in squares], not whiteToMove)
+                    if legal[predecessor]:
+                        predecessors.add(predecessor)
+            clearBoard(gs, squares)
+            for predecessor in predecessors:
+                updatePredecessor(values, remaining, frontier, predecessor, values[index] < 0, plies)
+        plies += 1
+
+    table.values = array('b', values)
+    table.save(directory)
+    loadedTables.pop(signature, None) # Forget a missing table, the saved file is loaded the next time it is needed
+    if verbose:
+        print(signature + ': ' + str(sum(legal)) + ' positions, ' + str(sum(1 for value in values if value != 0)) + ' won or lost, longest mate ' +
+              str(max(abs(value) for value in values) - 1) + ' plies, ' + format(time.perf_counter() - startTime, '.1f') + 's')
+    return table
+
+'''
+A successor of the position at index is decided at plies. If it is lost the position is won in plies + 1, if it is won that is one less
+successor left, and when none are left the position is lost in plies + 1
+'''
+def updatePredecessor(values, remaining, frontier, index, successorLost, plies):
+    if values[index] != 0:
+        return
+    if successorLost:
+        values[index] = plies + 2
+        frontier[plies + 1].append(index)
+    else:
+        remaining[index] -= 1
+        if remaining[index] == 0:
+            values[index] = -(plies + 2)
+            frontier[plies + 1].append(index)
+
+def setUpBoard(gs, pieces, squares, whiteToMove):
+    for i in range(len(pieces)):
+        gs.board[squares[i] // 8][squares[i] % 8] = pieces[i]
+        if pieces[i] == 'wK':
+            gs.whiteKingLocation = (squares[i] // 8, squares[i] % 8)
+        elif pieces[i] == 'bK':
+            gs.blackKingLocation = (squares[i] // 8, squares[i] % 8)
+    gs.whiteToMove = whiteToMove
+
+def clearBoard(gs, squares):
+    for square in squares:
+        gs.board[square // 8][square % 8] = '--'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate endgame tables')
+    parser.add_argument('signatures', nargs='*', help='material to generate, like KQvKR (white has the stronger side)')
+    parser.add_argument('--four', action='store_true', help='generate every 4 piece table')
+    parser.add_argument('--dir', default=TABLE_DIR, help='directory for the table files')
+    args = parser.parse_args()
+    signatures = args.signatures or THREE_PIECE + (FOUR_PIECE if args.four else [])
+    for signature in signatures:
+        if signature != materialSignature(signaturePieces(signature))[0]:
+            parser.error(signature + ' should be written ' + materialSignature(signaturePieces(signature))[0])
+        generateTable(signature, args.dir)
@@ -0,0 +1,124 @@
+'''
+Runs the engine over every position of a PGN archive. The games are streamed from the file, the positions are searched to a fixed depth on
+worker processes and each result is written as a CSV or JSON Lines row as soon as it is in, with the throughput in positions/second.
+    python GameAnalysis.py games.pgn -o analysis.csv -d 3 -w 4
+    python GameAnalysis.py games.pgn -o analysis.jsonl --max-games 100
+Every row has the game and ply, the FEN, the move played and the engine's best move, the score in centipawns for white, and the centipawns the
+move played lost compared to the best move (for finding blunders). Mates score +-SmartMoveFinder.CHECKMATE less the plies to the mate.
+'''
+import argparse
+import csv
+import itertools
+import json
+import random
+import sys
+import time
+import ChessEngine
+import PGNReader
+import SmartMoveFinder
+
+FIELDS = ('game', 'ply', 'fen', 'move', 'bestMove', 'score', 'loss', 'nodes', 'seconds')
+BATCH_SIZE = 1000 # Positions handed to the pool at a time, so the archive is never read much further ahead than the workers
+PROGRESS_INTERVAL = 10 # Seconds between progress lines
+
+'''
+Search one position, runs in a worker process. The move played is searched from the same position to the same depth as the best move, with
+it as the only root move, so the loss compares two scores from one horizon. The search starts from an empty table and history each time,
+so a position gets the same result whichever worker has it and whatever it analysed before. Returns the result row
+'''
+def analysePosition(position, depth):
+    gameNumber, ply, fen, san = position
+    SmartMoveFinder.transpositionTable.clear()
+    SmartMoveFinder.historyScores.clear()
+    random.seed(fen) # Equal root moves are shuffled, the same position always picks the same one
+    gs = ChessEngine.GameState(fen)
+    validMoves = gs.getValidMoves()
+    start = time.perf_counter()
+    bestMove = None
+    score = 0
+    loss = None
+    nodes = 0
+    if len(validMoves) == 0:
+        score = -SmartMoveFinder.CHECKMATE if gs.checkmate else SmartMoveFinder.STALEMATE
+    else:
+        bestMove, score = searchScore(gs, validMoves, depth)
+        nodes = SmartMoveFinder.nodesSearched
+        if san:
+            playedMove = gs.parseMove(san)
+            if playedMove == bestMove:
+                loss = 0
+            else:
+                playedScore = searchScore(gs, [playedMove], depth)[1]
+                nodes += SmartMoveFinder.nodesSearched
+                loss = max(0, score - playedScore)
+    return {'game': gameNumber, 'ply': ply, 'fen': fen, 'move': san, 'bestMove': gs.getSAN(bestMove) if bestMove is not None else '',
+            'score': score if gs.whiteToMove else -score, 'loss': loss, 'nodes': nodes, 'seconds': round(time.perf_counter() - start, 4)}
+
+'''
+findBestMove over rootMoves to depth, returns (move, score for the side to move)
+'''
+def searchScore(gs, rootMoves, depth):
+    scores = []
+    move = SmartMoveFinder.findBestMove(gs, rootMoves, depth, float('inf'), infoCallback=lambda d, s, m: scores.append(s))
+    return move, scores[-1] if scores else 0
+
+def analysePositionTask(task):
+    return analysePosition(*task)
+
+'''
+Analyse every position of the games, calling write(row) for each in order. Returns the number of positions
+'''
+def analyseGames(games, write, depth=SmartMoveFinder.DEPTH, workers=SmartMoveFinder.WORKERS, errors=None):
+    positions = PGNReader.iterPositions(games, errors)
+    tasks = ((position, depth) for position in positions)
+    pool = SmartMoveFinder.getWorkerPool(workers) if workers > 1 else None
+    start = lastReport = time.perf_counter()
+    count = 0
+    while True:
+        batch = list(itertools.islice(tasks, BATCH_SIZE))
+        if not batch:
+            break
+        results = pool.imap(analysePositionTask, batch, chunksize=8) if pool is not None else map(analysePositionTask, batch)
+        for row in results:
+            write(row)
+            count += 1
+            if time.perf_counter() - lastReport >= PROGRESS_INTERVAL:
+                lastReport = time.perf_counter()
+                print(str(count) + ' positions, ' + format(count / (lastReport - start), '.1f') + ' positions/s', file=sys.stderr, flush=True)
+    elapsed = time.perf_counter() - start
+    print(str(count) + ' positions in ' + format(elapsed, '.1f') + 's, ' + format(count / max(elapsed, 1e-9), '.1f') + ' positions/s',
+          file=sys.stderr)
+    return count
+
+'''
+A write function for analyseGames that puts rows in outputFile, as CSV or (jsonLines) one JSON object per line
+'''
+def makeWriter(outputFile, jsonLines):
+    if jsonLines:
+        def write(row):
+            outputFile.write(json.dumps(row) + '\n')
+        return write
+    writer = csv.DictWriter(outputFile, FIELDS)
+    writer.writeheader()
+    return writer.writerow
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyse every position of a PGN file with the engine')
+    parser.add_argument('pgn', help='PGN file of the games')
+    parser.add_argument('-o', '--output', help='.csv or .jsonl file for the results, JSON Lines on stdout if left out')
+    parser.add_argument('-d', '--depth', type=int, default=SmartMoveFinder.DEPTH, help='search depth for every position')
+    parser.add_argument('-w', '--workers', type=int, default=SmartMoveFinder.WORKERS, help='worker processes')
+    parser.add_argument('--max-games', type=int, help='only the first this many games')
+    args = parser.parse_args()
+    errors = []
+    with open(args.pgn) as pgnFile:
+        games = PGNReader.readGames(pgnFile)
+        if args.max_games is not None:
+            games = itertools.islice(games, args.max_games)
+        outputFile = open(args.output, 'w', newline='') if args.output else sys.stdout
+        analyseGames(games, makeWriter(outputFile, not (args.output or '').lower().endswith('.csv')), args.depth, args.workers, errors)
+        if outputFile is not sys.stdout:
+            outputFile.close()
+    SmartMoveFinder.closeWorkerPool()
+    for gameNumber, ply, error in errors:
+        print('Game ' + str(gameNumber) + ' stopped at ply ' + str(ply) + ': ' + error, file=sys.stderr)
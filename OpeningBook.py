@@ -0,0 +1,124 @@
+'''
+Opening book. The book file is a sorted list of (Zobrist key, moveID, weight) entries that is memory mapped and binary searched, so opening it
+reads nothing and every process that opens the same file shares the pages. Build one from a PGN file or a file of move lists:
+    python OpeningBook.py openings.txt book.bin          one game per line, moves in coordinates (e2e4) or SAN (e4)
+    python OpeningBook.py games.pgn book.bin -p 16       PGN, first 16 plies of every game
+'''
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import ChessEngine
+import PGNReader
+
+MAGIC = b'LEBOOK01'
+headerFormat = struct.Struct('=8sQ') # Magic and the number of entries
+entryFormat = struct.Struct('=Qii') # Key, moveID, weight. Native byte order so the file can be read through memoryview casts
+MAX_PLY = 20 # Plies of every game that go into the book
+
+class OpeningBook():
+    def __init__(self, path):
+        self.bookFile = open(path, 'rb')
+        self.data = mmap.mmap(self.bookFile.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:8] != MAGIC:
+            self.close()
+            raise ValueError('Not an opening book: ' + path)
+        self.size = headerFormat.unpack_from(self.data)[1]
+        # Views straight onto the mapped file, entry i has its key at keys[2*i] and its moveID and weight at fields[4*i+2], fields[4*i+3]
+        entries = memoryview(self.data)[headerFormat.size:headerFormat.size + self.size * entryFormat.size]
+        self.keys = entries.cast('Q')
+        self.fields = entries.cast('i')
+
+    '''
+    The book moves for a position as a list of (moveID, weight), most played first. Empty when the position isn't in the book
+    '''
+    def getMoves(self, key):
+        keys = self.keys
+        low, high = 0, self.size
+        while low < high: # First entry with this key
+            middle = (low + high) // 2
+            if keys[2 * middle] < key:
+                low = middle + 1
+            else:
+                high = middle
+        moves = []
+        while low < self.size and keys[2 * low] == key:
+            moves.append((self.fields[4 * low + 2], self.fields[4 * low + 3]))
+            low += 1
+        return moves
+
+    '''
+    Pick one of the valid moves the book has for the position, at random weighted by how often it was played. None when there is none
+    '''
+    def findMove(self, gs, validMoves, rng=random):
+        movesByID = {move.moveID: move for move in validMoves}
+        choices = [(movesByID[moveID], weight) for moveID, weight in self.getMoves(gs.zobristKey) if moveID in movesByID]
+        if not choices:
+            return None
+        return rng.choices([move for move, weight in choices], [weight for move, weight in choices])[0]
+
+    def close(self):
+        if hasattr(self, 'keys'): # The map can't close while views of it are still around
+            self.keys.release()
+            self.fields.release()
+        self.data.close()
+        self.bookFile.close()
+
+'''
+Write a book from PGNReader.PGNGame objects, their moves are any strings GameState.parseMove reads and a FEN tag sets the starting position.
+The first maxPly plies of every game are counted, the weight of a book move is how many games played it. A game with a FEN or a move that
+can't be read is left out and reported through the errors list if one is given. Returns the number of entries
+'''
+def buildBook(games, path, maxPly=MAX_PLY, errors=None):
+    counts = {} # (key, moveID): games
+    for gameNumber, game in enumerate(games, 1):
+        gameEntries = []
+        ply = 0
+        try:
+            gs = ChessEngine.GameState(game.tags.get('FEN'))
+            for ply, text in enumerate(game.moves[:maxPly]):
+                move = gs.parseMove(text)
+                gameEntries.append((gs.zobristKey, move.moveID))
+                gs.makeMove(move)
+        except ValueError as error:
+            if errors is not None:
+                errors.append((gameNumber, ply, str(error)))
+            continue
+        for entry in gameEntries:
+            counts[entry] = counts.get(entry, 0) + 1
+    entries = sorted(counts.items(), key=lambda item: (item[0][0], -item[1]))
+    with open(path, 'wb') as bookFile:
+        bookFile.write(headerFormat.pack(MAGIC, len(entries)))
+        for (key, moveID), weight in entries:
+            bookFile.write(entryFormat.pack(key, moveID, min(weight, 2**31 - 1)))
+    return len(entries)
+
+'''
+Read the games from a PGN file or a file of move lists (one game per line from the start position, '#' starts a comment line). Yields a
+PGNReader.PGNGame per game
+'''
+def readGames(path):
+    with open(path) as gameFile:
+        if os.path.splitext(path)[1].lower() != '.pgn':
+            for line in gameFile:
+                line = line.split('#')[0].strip()
+                if line:
+                    game = PGNReader.PGNGame()
+                    game.moves = line.split()
+                    yield game
+            return
+        yield from PGNReader.readGames(gameFile)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build an opening book from a PGN file or a file of move lists')
+    parser.add_argument('games', help='.pgn file, or a text file with one game of moves per line')
+    parser.add_argument('book', help='book file to write')
+    parser.add_argument('-p', '--plies', type=int, default=MAX_PLY, help='plies of every game to put in the book')
+    args = parser.parse_args()
+    errors = []
+    entries = buildBook(readGames(args.games), args.book, args.plies, errors)
+    for gameNumber, ply, error in errors:
+        print('Game ' + str(gameNumber) + ' left out at ply ' + str(ply) + ': ' + error, file=sys.stderr)
+    print('Wrote ' + str(entries) + ' entries to ' + args.book)
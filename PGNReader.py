@@ -0,0 +1,88 @@
+'''
+Streaming PGN reader. Games are read one at a time from the file, so an archive of any size is read in the memory of a single game.
+    for game in PGNReader.readGames(open('games.pgn')):
+        game.tags['White'], game.moves, game.result
+    for gameNumber, ply, fen, san in PGNReader.iterPositions(PGNReader.readGames(open('games.pgn'))):
+        ...
+Comments ({...} and ; to the end of the line), variations, move numbers, NAGs ($1) and annotations (!, ?) are skipped.
+'''
+import re
+import ChessEngine
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+tagPattern = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+tokenPattern = re.compile(r'[{}();]|[^\s{}();]+')
+moveNumberPattern = re.compile(r'^\d+\.+')
+
+class PGNGame():
+    def __init__(self):
+        self.tags = {}
+        self.moves = [] # SAN, as written in the file
+        self.result = '*'
+
+'''
+Generator of the PGNGame objects in a PGN file (or any iterable of lines)
+'''
+def readGames(lines):
+    game = PGNGame()
+    inMoves = False # The movetext of game has started, the next tag starts a new game
+    inComment = False
+    variationDepth = 0
+    for line in lines:
+        if not inComment and variationDepth == 0:
+            if line.startswith('%'): # Escaped line
+                continue
+            if line.lstrip().startswith('['):
+                if inMoves:
+                    yield game
+                    game = PGNGame()
+                    inMoves = False
+                for name, value in tagPattern.findall(line):
+                    game.tags[name] = value.replace('\\"', '"').replace('\\\\', '\\')
+                continue
+        for token in tokenPattern.findall(line):
+            if inComment:
+                inComment = token != '}'
+            elif token == '{':
+                inComment = True
+            elif token == ';': # Comment to the end of the line
+                break
+            elif token == '(':
+                variationDepth += 1
+            elif token == ')':
+                variationDepth = max(0, variationDepth - 1)
+            elif variationDepth == 0:
+                inMoves = True
+                if token in RESULTS:
+                    game.result = token
+                    yield game
+                    game = PGNGame()
+                    inMoves = False
+                    continue
+                token = moveNumberPattern.sub('', token) # 1. and 1... or 12.e4 written together
+                if token and not token.startswith('$'):
+                    game.moves.append(token.rstrip('!?'))
+    if inMoves or game.tags:
+        yield game
+
+'''
+Replay games and yield every position in them as (gameNumber, ply, FEN, SAN of the move played from it). The last position of each game is
+yielded with '' for the move. A game with a move that isn't valid stops there, it is reported through the errors list if one is given
+'''
+def iterPositions(games, errors=None):
+    for gameNumber, game in enumerate(games, 1):
+        gs = ChessEngine.GameState(game.tags.get('FEN'))
+        for ply in range(len(game.moves) + 1):
+            fen = gs.getFEN()
+            if ply == len(game.moves):
+                yield gameNumber, ply, fen, ''
+                break
+            try:
+                move = gs.parseMove(game.moves[ply])
+            except ValueError as error:
+                if errors is not None:
+                    errors.append((gameNumber, ply, str(error)))
+                yield gameNumber, ply, fen, ''
+                break
+            yield gameNumber, ply, fen, game.moves[ply]
+            gs.makeMove(move)
@@ -0,0 +1,139 @@
+'''
+Perft (performance test) for the move generator. Counts the leaf nodes of the game tree to a given depth from standard test positions,
+checks them against the known counts and reports nodes per second. It uses ChessEngine.GameState directly, so no pygame is needed.
+    python Perft.py                   run the test positions to depth 4
+    python Perft.py -d 5 --compact    deeper, with CompactGameState
+    python Perft.py -d 3 --divide     node counts split by root move
+    python Perft.py -d 3 --compare    check getValidMoves against getValidMovesByFiltering at every node
+'''
+import argparse
+import sys
+import time
+import ChessEngine
+
+# (name, FEN, known leaf node counts for depth 1, 2, 3...)
+TEST_POSITIONS = [
+    ('startpos', ChessEngine.START_FEN, [20, 400, 8902, 197281, 4865609, 119060324]),
+    # Lots of castling, en passant and pins, promotions from depth 4 on
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1', [48, 2039, 97862, 4085603, 193690690]),
+    # Rook and pawn endgame with checks and en passant pins along the rank
+    ('position3', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', [14, 191, 2812, 43238, 674624, 11030083]),
+    # Promotions and underpromotions with captures from the first plies
+    ('position4', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', [6, 264, 9467, 422333, 15833292]),
+    ('position5', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', [44, 1486, 62379, 2103487, 89941194]),
+    ('position6', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10', [46, 2079, 89890, 3894594]),
+]
+
+'''
+Count the leaf nodes depth plies below the current position. The last ply is counted straight from the move list without playing the moves
+'''
+def perft(gs, depth):
+    moves = gs.getValidMoves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+'''
+Perft split by root move, returns a dict of chess notation: leaf nodes under that move
+'''
+def divide(gs, depth):
+    counts = {}
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        counts[move.getChessNotation()] = perft(gs, depth - 1)
+        gs.undoMove()
+    return counts
+
+'''
+Sorted (moveID, isEnpassantMove, isCastleMove) for a list of moves so two move lists can be compared
+'''
+def moveSignature(moves):
+    return sorted((move.moveID, move.isEnpassantMove, move.isCastleMove) for move in moves)
+
+'''
+Compare both move generators at every node down to depth. Returns the number of leaf nodes and the mismatches found as (line, extra moves, missing moves)
+'''
+def compareMoveGenerators(gs, depth, line=None, mismatches=None):
+    if line is None:
+        line = []
+    if mismatches is None:
+        mismatches = []
+    moves = gs.getValidMoves()
+    referenceMoves = gs.getValidMovesByFiltering()
+    if moveSignature(moves) != moveSignature(referenceMoves):
+        extra = [move.getChessNotation() for move in moves if move not in referenceMoves]
+        missing = [move.getChessNotation() for move in referenceMoves if move not in moves]
+        mismatches.append((' '.join(line), extra, missing))
+    if depth == 1:
+        return len(moves), mismatches
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        line.append(move.getChessNotation())
+        nodes += compareMoveGenerators(gs, depth - 1, line, mismatches)[0]
+        line.pop()
+        gs.undoMove()
+    return nodes, mismatches
+
+'''
+Run perft on every test position up to maxDepth (or as deep as the known counts go, for positions that have them). Prints a line per depth
+and returns False if any count was wrong
+'''
+def runSuite(maxDepth, gameState=ChessEngine.GameState, positions=TEST_POSITIONS):
+    allPassed = True
+    totalNodes = 0
+    totalTime = 0
+    for name, fen, counts in positions:
+        for depth in range(1, (min(maxDepth, len(counts)) if counts else maxDepth) + 1):
+            gs = gameState(fen)
+            start = time.perf_counter()
+            nodes = perft(gs, depth)
+            elapsed = time.perf_counter() - start
+            totalNodes += nodes
+            totalTime += elapsed
+            if not counts:
+                result = ''
+            elif nodes == counts[depth - 1]:
+                result = ' ok'
+            else:
+                result = ' FAILED, expected ' + str(counts[depth - 1])
+                allPassed = False
+            print(name + ' depth ' + str(depth) + ': ' + str(nodes) + ' nodes in ' + format(elapsed, '.2f') + 's, ' +
+                  str(int(nodes / max(elapsed, 1e-9))) + ' nodes/s' + result)
+    if totalTime > 0:
+        print('Total: ' + str(totalNodes) + ' nodes in ' + format(totalTime, '.2f') + 's, ' + str(int(totalNodes / totalTime)) + ' nodes/s')
+    return allPassed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Perft node counts for ChessEngine')
+    parser.add_argument('-d', '--depth', type=int, default=4, help='deepest depth to count')
+    parser.add_argument('--compact', action='store_true', help='use CompactGameState')
+    parser.add_argument('--fen', help='position to use instead of the test positions (no known counts to check against)')
+    parser.add_argument('--divide', action='store_true', help='split the count for the first test position by root move')
+    parser.add_argument('--compare', action='store_true', help='compare getValidMoves with getValidMovesByFiltering at every node')
+    args = parser.parse_args()
+    gameState = ChessEngine.CompactGameState if args.compact else ChessEngine.GameState
+    positions = TEST_POSITIONS if args.fen is None else [('fen', args.fen, [])]
+
+    if args.divide:
+        name, fen, counts = positions[0]
+        counts = divide(gameState(fen), args.depth)
+        for notation in sorted(counts):
+            print(notation + ': ' + str(counts[notation]))
+        print('Moves: ' + str(len(counts)) + ' Nodes: ' + str(sum(counts.values())))
+    elif args.compare:
+        allMatched = True
+        for name, fen, counts in positions:
+            nodes, mismatches = compareMoveGenerators(gameState(fen), args.depth)
+            for line, extra, missing in mismatches:
+                print(name + ' mismatch after [' + line + '] extra: ' + str(extra) + ' missing: ' + str(missing))
+            print(name + ' depth ' + str(args.depth) + ': ' + str(nodes) + ' nodes, ' + str(len(mismatches)) + ' mismatches')
+            allMatched = allMatched and not mismatches
+        sys.exit(0 if allMatched else 1)
+    else:
+        sys.exit(0 if runSuite(args.depth, gameState, positions) else 1)
@@ -0,0 +1,237 @@
+'''
+Search instrumentation. enable() wraps the move generator, evaluation and search functions with counters and timers, disable() puts the
+originals back, so nothing is measured and nothing is slowed down while it is off.
+    Profiler.enable('trace.json', logInterval=5)
+    ... play or search ...
+    print(Profiler.formatStats())
+    Profiler.disable()
+Counts calls and time in each phase, legal moves per position, nodes and effective branching factor per iteration, transposition table hit and
+cutoff rates and the time of every move. The trace file opens in chrome://tracing or https://ui.perfetto.dev, with a slice for every move
+searched and every iteration inside it. Searches in findBestMoveParallel's worker processes are not seen, only the process it is enabled in.
+'''
+import json
+import threading
+import time
+import ChessEngine
+import SmartMoveFinder
+
+# Functions wrapped while the profiler is on. Their times include whatever they call
+GAME_STATE_FUNCTIONS = ('getValidMoves', 'getAllPossibleMoves', 'squareAttackedBy', 'makeMove', 'undoMove')
+SEARCH_FUNCTIONS = ('findBookMove', 'quiescence', 'scoreBoard', 'orderMoves', 'scoreFromEndgameTables')
+MOVE_GENERATORS = ('getValidMoves', 'getAllPossibleMoves') # The number of moves they return is added up too
+
+enabled = False
+originals = [] # (owner, name, function) replaced by enable
+callCounts = {} # Name: calls
+callTimes = {} # Name: seconds, recursive calls are only timed once
+movesGenerated = {} # Name: moves returned by the move generators
+iterationNodes = {} # Depth: nodes searched by iterations to that depth
+searchedMoves = [] # (seconds, nodes) for each findBestMove
+tableProbes = tableHits = 0
+cutoffs = firstMoveCutoffs = 0
+traceEvents = []
+tracePath = None
+startTime = 0
+logThread = None
+logStop = None
+
+'''
+Start counting. traceFile is written by disable(), with logInterval a line of stats goes to log every that many seconds
+'''
+def enable(traceFile=None, logInterval=None, log=print):
+    global enabled, tracePath, logThread, logStop
+    if enabled:
+        return
+    reset()
+    tracePath = traceFile
+    for cls in (ChessEngine.GameState, ChessEngine.CompactGameState):
+        for name in GAME_STATE_FUNCTIONS:
+            if name in cls.__dict__: # Only the class's own version, a subclass calling its parent is counted under both names
+                wrap(cls, name, cls.__name__ + '.' + name)
+    for name in SEARCH_FUNCTIONS:
+        wrap(SmartMoveFinder, name, name)
+    wrapSearch()
+    enabled = True
+    if logInterval:
+        logStop = threading.Event()
+        logThread = threading.Thread(target=logStats, args=(logInterval, log, logStop), daemon=True)
+        logThread.start()
+
+'''
+Stop counting and put the original functions back. The counts stay until the next enable()
+'''
+def disable():
+    global enabled, logThread
+    if not enabled:
+        return
+    for owner, name, function in reversed(originals):
+        setattr(owner, name, function)
+    originals.clear()
+    enabled = False
+    if logThread is not None:
+        logStop.set()
+        logThread.join()
+        logThread = None
+    if tracePath is not None:
+        writeTrace(tracePath)
+
+def reset():
+    global tableProbes, tableHits, cutoffs, firstMoveCutoffs, startTime
+    callCounts.clear()
+    callTimes.clear()
+    movesGenerated.clear()
+    iterationNodes.clear()
+    searchedMoves.clear()
+    traceEvents.clear()
+    tableProbes = tableHits = 0
+    cutoffs = firstMoveCutoffs = 0
+    startTime = time.perf_counter()
+
+'''
+Replace owner.name with a version that counts its calls and time under label
+'''
+def wrap(owner, name, label):
+    function = getattr(owner, name)
+    originals.append((owner, name, function))
+    callCounts[label] = 0
+    callTimes[label] = 0.0
+    countMoves = name in MOVE_GENERATORS
+    if countMoves:
+        movesGenerated[label] = 0
+    active = [0] # Calls of this function under way, only the outermost one of a recursion is timed
+    perfCounter = time.perf_counter
+
+    def counted(*args, **kwargs):
+        callCounts[label] += 1
+        active[0] += 1
+        start = perfCounter()
+        try:
+            result = function(*args, **kwargs)
+        finally:
+            active[0] -= 1
+            if active[0] == 0:
+                callTimes[label] += perfCounter() - start
+        if countMoves:
+            movesGenerated[label] += len(result)
+        return result
+    setattr(owner, name, counted)
+
+'''
+Wrap findBestMove and the root search to time each move and iteration, and take the table and cutoff counters from every search
+'''
+def wrapSearch():
+    findBestMove = SmartMoveFinder.findBestMove
+    searchRoot = SmartMoveFinder.findMoveNegaMaxAlphaBetaRoot
+    originals.append((SmartMoveFinder, 'findBestMove', findBestMove))
+    originals.append((SmartMoveFinder, 'findMoveNegaMaxAlphaBetaRoot', searchRoot))
+
+    def profiledFindBestMove(gs, validMoves, *args, **kwargs):
+        global tableProbes, tableHits, cutoffs, firstMoveCutoffs
+        table = SmartMoveFinder.transpositionTable
+        probes, hits = table.probes, table.hits
+        start = time.perf_counter()
+        move = findBestMove(gs, validMoves, *args, **kwargs)
+        end = time.perf_counter()
+        nodes = SmartMoveFinder.nodesSearched
+        searchedMoves.append((end - start, nodes))
+        tableProbes += table.probes - probes
+        tableHits += table.hits - hits
+        cutoffs += SmartMoveFinder.cutoffs
+        firstMoveCutoffs += SmartMoveFinder.firstMoveCutoffs
+        addTraceEvent('move ' + str(len(searchedMoves)) + (' ' + move.getChessNotation() if move is not None else ''), start, end,
+                      {'nodes': nodes, 'fen': gs.getFEN()})
+        return move
+
+    def profiledSearchRoot(gs, validMoves, depth):
+        nodes = SmartMoveFinder.nodesSearched
+        start = time.perf_counter()
+        result = searchRoot(gs, validMoves, depth)
+        iterationNodes[depth] = iterationNodes.get(depth, 0) + SmartMoveFinder.nodesSearched - nodes
+        addTraceEvent('depth ' + str(depth), start, time.perf_counter(), {'nodes': SmartMoveFinder.nodesSearched - nodes})
+        return result
+
+    SmartMoveFinder.findBestMove = profiledFindBestMove
+    SmartMoveFinder.findMoveNegaMaxAlphaBetaRoot = profiledSearchRoot
+
+'''
+A complete event in Chrome's trace format, times in microseconds from enable()
+'''
+def addTraceEvent(name, start, end, args):
+    traceEvents.append({'name': name, 'ph': 'X', 'ts': (start - startTime) * 1e6, 'dur': (end - start) * 1e6, 'pid': 1,
+                        'tid': threading.get_ident(), 'args': args})
+
+def writeTrace(path):
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms', 'otherData': getStats()}, file)
+
+'''
+Everything counted so far as a dict
+'''
+def getStats():
+    elapsed = time.perf_counter() - startTime
+    moveTimes = sorted(seconds for seconds, nodes in searchedMoves)
+    nodes = sum(nodes for seconds, nodes in searchedMoves)
+    searchTime = sum(moveTimes)
+    depths = sorted(iterationNodes)
+    generated = sum(movesGenerated.values())
+    return {
+        'seconds': elapsed,
+        'moves': len(searchedMoves),
+        'nodes': nodes,
+        'nodesPerSecond': nodes / searchTime if searchTime else 0.0,
+        'moveTime': {'avg': searchTime / len(moveTimes) if moveTimes else 0.0, 'p50': percentile(moveTimes, 50),
+                     'p90': percentile(moveTimes, 90), 'max': moveTimes[-1] if moveTimes else 0.0},
+        'calls': dict(callCounts),
+        'functionTimes': dict(callTimes),
+        'functionShares': {name: seconds / searchTime for name, seconds in callTimes.items()} if searchTime else {},
+        'movesGenerated': generated,
+        # Moves per getValidMoves call, quiescence's captures only calls make it lower than the full branching factor
+        'movesPerPosition': movesGenerated.get('GameState.getValidMoves', 0) / max(callCounts.get('GameState.getValidMoves', 0), 1),
+        'iterationNodes': {depth: iterationNodes[depth] for depth in depths},
+        # Nodes an iteration takes over the one before it
+        'effectiveBranchingFactor': {depths[i]: iterationNodes[depths[i]] / iterationNodes[depths[i - 1]]
+                                     for i in range(1, len(depths)) if iterationNodes[depths[i - 1]]},
+        'tableProbes': tableProbes,
+        'tableHitRate': tableHits / tableProbes if tableProbes else 0.0,
+        'cutoffs': cutoffs,
+        'firstMoveCutoffRate': firstMoveCutoffs / cutoffs if cutoffs else 0.0,
+    }
+
+'''
+The value at percent (0-100) of a sorted list
+'''
+def percentile(values, percent):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+'''
+One line summary, for the periodic log
+'''
+def formatLine():
+    stats = getStats()
+    return (str(stats['moves']) + ' moves, ' + str(stats['nodes']) + ' nodes, ' + format(stats['nodesPerSecond'], '.0f') + ' nodes/s, move time p50 ' +
+            format(stats['moveTime']['p50'], '.3f') + 's max ' + format(stats['moveTime']['max'], '.3f') + 's, table hits ' +
+            format(stats['tableHitRate'] * 100, '.1f') + '%, first move cutoffs ' + format(stats['firstMoveCutoffRate'] * 100, '.1f') + '%')
+
+'''
+Full report, a line per function with its calls, time and share of the search time, then the iterations
+'''
+def formatStats():
+    stats = getStats()
+    lines = [formatLine()]
+    lines.append('moves per position ' + format(stats['movesPerPosition'], '.1f') + ', move time avg ' +
+                 format(stats['moveTime']['avg'], '.3f') + 's p90 ' + format(stats['moveTime']['p90'], '.3f') + 's')
+    for name in sorted(callTimes, key=callTimes.get, reverse=True):
+        if callCounts[name] == 0:
+            continue
+        lines.append(format(name, '<34') + format(callCounts[name], '>10') + ' calls ' + format(callTimes[name], '>9.3f') + 's ' +
+                     format(stats['functionShares'].get(name, 0) * 100, '>5.1f') + '%')
+    for depth, nodes in stats['iterationNodes'].items():
+        branching = stats['effectiveBranchingFactor'].get(depth)
+        lines.append('depth ' + str(depth) + ': ' + str(nodes) + ' nodes' + (', branching factor ' + format(branching, '.2f') if branching else ''))
+    return '\n'.join(lines)
+
+def logStats(interval, log, stop):
+    while not stop.wait(interval):
+        log(formatLine())
@@ -0,0 +1,68 @@
+'''
+Compares the single core search with the root split parallel search on the Perft test positions and reports the speedup.
+    python SearchBenchmark.py                  depth 3, one worker per CPU
+    python SearchBenchmark.py -d 4 -w 4        deeper, with 4 workers
+    python SearchBenchmark.py --fen "<FEN>"    one position instead of the test positions
+    python SearchBenchmark.py --profile        where the single core search spends its time, --trace trace.json for a Chrome trace
+'''
+import argparse
+import time
+import ChessEngine
+import Perft
+import Profiler
+import SmartMoveFinder
+
+'''
+Search every position once with findBestMove and once with findBestMoveParallel. Prints a line per position with the time and nodes of each
+and returns (single core seconds, parallel seconds)
+'''
+def runBenchmark(depth, workers, positions=Perft.TEST_POSITIONS, timeLimit=3600):
+    totalSingle = 0
+    totalParallel = 0
+    SmartMoveFinder.getWorkerPool(workers) # Start the processes before the clock does
+    for name, fen, counts in positions:
+        gs = ChessEngine.GameState(fen)
+        SmartMoveFinder.transpositionTable.clear()
+        start = time.perf_counter()
+        singleMove = SmartMoveFinder.findBestMove(gs, gs.getValidMoves(), depth, timeLimit)
+        singleTime = time.perf_counter() - start
+        singleNodes = SmartMoveFinder.nodesSearched
+
+        gs = ChessEngine.GameState(fen)
+        SmartMoveFinder.transpositionTable.clear()
+        start = time.perf_counter()
+        parallelMove = SmartMoveFinder.findBestMoveParallel(gs, gs.getValidMoves(), depth, timeLimit, workers)
+        parallelTime = time.perf_counter() - start
+        parallelNodes = SmartMoveFinder.nodesSearched
+
+        totalSingle += singleTime
+        totalParallel += parallelTime
+        print(name + ': single ' + formatMove(singleMove) + ' ' + str(singleNodes) + ' nodes in ' + format(singleTime, '.2f') + 's, ' +
+              'parallel ' + formatMove(parallelMove) + ' ' + str(parallelNodes) + ' nodes in ' + format(parallelTime, '.2f') + 's, ' +
+              'speedup ' + format(singleTime / max(parallelTime, 1e-9), '.2f') + 'x')
+    SmartMoveFinder.closeWorkerPool()
+    print('Total: single ' + format(totalSingle, '.2f') + 's, parallel ' + format(totalParallel, '.2f') + 's with ' + str(workers) +
+          ' workers, speedup ' + format(totalSingle / max(totalParallel, 1e-9), '.2f') + 'x')
+    return totalSingle, totalParallel
+
+'''
+A searched move for printing, the search gives back None when it had no time to finish anything
+'''
+def formatMove(move):
+    return move.getChessNotation() if move is not None else 'none'
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single core vs parallel search speed for SmartMoveFinder')
+    parser.add_argument('-d', '--depth', type=int, default=SmartMoveFinder.DEPTH, help='search depth')
+    parser.add_argument('-w', '--workers', type=int, default=SmartMoveFinder.WORKERS, help='worker processes for the parallel search')
+    parser.add_argument('--fen', help='position to use instead of the test positions')
+    parser.add_argument('--profile', action='store_true', help='count calls and time in the single core search')
+    parser.add_argument('--trace', help='write a Chrome trace of the single core search to this file')
+    args = parser.parse_args()
+    positions = Perft.TEST_POSITIONS if args.fen is None else [('fen', args.fen, [])]
+    if args.profile or args.trace:
+        Profiler.enable(args.trace) # Only sees this process, so only the single core searches
+    runBenchmark(args.depth, args.workers, positions)
+    if Profiler.enabled:
+        print(Profiler.formatStats())
+        Profiler.disable()
@@ -0,0 +1,200 @@
+'''
+Headless self-play. Two engine settings play a match of games in parallel worker processes, without pygame. The games are written as PGN
+and at the end the results, games/hour, average nodes per move and the time per move percentiles are printed.
+    python SelfPlay.py -n 20 -w 4 --engine1 depth=3 --engine2 depth=2 --pgn selfplay.pgn
+An engine setting is a comma separated list of name=..., depth=..., time=... (seconds per move) and book=0/1.
+'''
+import argparse
+import multiprocessing
+import random
+import time
+import ChessEngine
+import EndgameTables
+import SmartMoveFinder
+
+MAX_PLIES = 300 # Games still going after this many plies are drawn
+
+class EngineSettings():
+    def __init__(self, name='engine', depth=SmartMoveFinder.DEPTH, timeLimit=SmartMoveFinder.TIME_LIMIT, useBook=True):
+        self.name = name
+        self.depth = depth
+        self.timeLimit = timeLimit
+        self.useBook = useBook
+
+    '''
+    Settings from text like 'name=deep,depth=4,time=2,book=0', anything left out keeps its default
+    '''
+    @classmethod
+    def parse(cls, text, name):
+        settings = cls(name)
+        for field in text.split(','):
+            if '=' not in field:
+                continue
+            key, value = field.split('=', 1)
+            if key == 'name':
+                settings.name = value
+            elif key == 'depth':
+                settings.depth = int(value)
+            elif key == 'time':
+                settings.timeLimit = float(value)
+            elif key == 'book':
+                settings.useBook = value not in ('0', 'false', 'no')
+            else:
+                raise ValueError('Unknown engine setting ' + key)
+        return settings
+
+'''
+How the game at gs has ended, as (result, termination), or None while it goes on
+'''
+def gameOver(gs, validMoves):
+    if len(validMoves) == 0:
+        if gs.inCheck():
+            return ('0-1' if gs.whiteToMove else '1-0'), 'checkmate'
+        return '1/2-1/2', 'stalemate'
+    if gs.halfmoveClock >= 100:
+        return '1/2-1/2', 'fifty moves'
+    if gs.getRepetitions() >= 3:
+        return '1/2-1/2', 'threefold repetition'
+    if gs.pieceCount <= 3:
+        pieces = [square for row in gs.board for square in row if square != '--']
+        if EndgameTables.materialSignature(pieces)[0] in EndgameTables.DRAWN_MATERIAL:
+            return '1/2-1/2', 'insufficient material'
+    if len(gs.moveLog) >= MAX_PLIES:
+        return '1/2-1/2', 'move limit'
+    return None
+
+'''
+Play one game, runs in a worker process. Returns a dict with the result, the moves in SAN and (nodes, seconds) for every move of each side
+'''
+def playGame(gameNumber, whiteSettings, blackSettings, seed):
+    random.seed(seed)
+    SmartMoveFinder.transpositionTable.clear()
+    if (whiteSettings.useBook or blackSettings.useBook) and SmartMoveFinder.openingBook is None:
+        SmartMoveFinder.loadOpeningBook()
+    gs = ChessEngine.GameState()
+    sanMoves = []
+    moveStats = {'white': [], 'black': []}
+    while True:
+        validMoves = gs.getValidMoves()
+        ending = gameOver(gs, validMoves)
+        if ending is not None:
+            break
+        settings = whiteSettings if gs.whiteToMove else blackSettings
+        start = time.perf_counter()
+        move = SmartMoveFinder.findBookMove(gs, validMoves) if settings.useBook else None
+        nodes = 0
+        if move is None:
+            move = SmartMoveFinder.findBestMove(gs, validMoves, settings.depth, settings.timeLimit)
+            nodes = SmartMoveFinder.nodesSearched
+            if move is None:
+                move = SmartMoveFinder.findRandomMove(validMoves)
+        moveStats['white' if gs.whiteToMove else 'black'].append((nodes, time.perf_counter() - start))
+        sanMoves.append(gs.getSAN(move))
+        gs.makeMove(move)
+    return {'gameNumber': gameNumber, 'white': whiteSettings.name, 'black': blackSettings.name, 'result': ending[0],
+            'termination': ending[1], 'moves': sanMoves, 'moveStats': moveStats}
+
+def playGameTask(task):
+    return playGame(*task)
+
+'''
+The game as PGN text
+'''
+def formatPGN(game, date):
+    tags = [('Event', 'Self-play'), ('Site', 'lowEloEngine'), ('Date', date), ('Round', str(game['gameNumber'])), ('White', game['white']),
+            ('Black', game['black']), ('Result', game['result']), ('Termination', game['termination'])]
+    lines = ['[' + name + ' "' + value + '"]' for name, value in tags]
+    lines.append('')
+    tokens = []
+    for i in range(len(game['moves'])):
+        if i % 2 == 0:
+            tokens.append(str(i // 2 + 1) + '.')
+        tokens.append(game['moves'][i])
+    tokens.append(game['result'])
+    line = ''
+    for token in tokens: # Movetext lines stay under 80 characters
+        if len(line) + len(token) + 1 > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = token if not line else line + ' ' + token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+'''
+The value at percent (0-100) of a sorted list, nearest rank
+'''
+def percentile(values, percent):
+    if not values:
+        return 0
+    return values[min(len(values) - 1, max(0, int(round(percent / 100 * len(values) + 0.5)) - 1))]
+
+'''
+Play games between engine1 and engine2 on workers processes, taking turns with white. Writes the PGN to pgnPath (if given) as games finish
+and returns the list of games
+'''
+def runMatch(games, engine1, engine2, workers=SmartMoveFinder.WORKERS, pgnPath=None, seed=None):
+    seed = seed if seed is not None else random.randrange(2**32)
+    tasks = [(n + 1, engine1 if n % 2 == 0 else engine2, engine2 if n % 2 == 0 else engine1, seed + n) for n in range(games)]
+    date = time.strftime('%Y.%m.%d')
+    results = []
+    start = time.perf_counter()
+    pgnFile = open(pgnPath, 'w') if pgnPath else None
+    with multiprocessing.Pool(workers) as pool:
+        for game in pool.imap_unordered(playGameTask, tasks):
+            results.append(game)
+            print('Game ' + str(game['gameNumber']) + ': ' + game['white'] + ' - ' + game['black'] + ' ' + game['result'] + ' (' +
+                  game['termination'] + ', ' + str(len(game['moves'])) + ' plies)', flush=True)
+            if pgnFile is not None:
+                pgnFile.write(formatPGN(game, date))
+                pgnFile.flush()
+    if pgnFile is not None:
+        pgnFile.close()
+    printStats(results, engine1, engine2, time.perf_counter() - start)
+    return results
+
+def printStats(results, engine1, engine2, elapsed):
+    points = {engine1.name: 0.0, engine2.name: 0.0}
+    wins = draws = losses = 0 # For engine1
+    for game in results:
+        if game['result'] == '1/2-1/2':
+            draws += 1
+            points[game['white']] += 0.5
+            points[game['black']] += 0.5
+        else:
+            winner = game['white'] if game['result'] == '1-0' else game['black']
+            points[winner] += 1
+            if winner == engine1.name:
+                wins += 1
+            else:
+                losses += 1
+    print(engine1.name + ' vs ' + engine2.name + ': +' + str(wins) + ' =' + str(draws) + ' -' + str(losses) + ', ' +
+          str(points[engine1.name]) + '-' + str(points[engine2.name]))
+    print(str(len(results)) + ' games in ' + format(elapsed, '.1f') + 's, ' + format(len(results) / max(elapsed, 1e-9) * 3600, '.0f') + ' games/hour')
+    for settings in (engine1, engine2):
+        moves = []
+        for game in results:
+            for color in ('white', 'black'):
+                if game[color] == settings.name:
+                    moves.extend(game['moveStats'][color])
+        searched = [stat for stat in moves if stat[0] > 0] # Book moves aren't searched
+        latencies = sorted(seconds for nodes, seconds in searched)
+        print(settings.name + ': ' + str(len(moves)) + ' moves, ' + str(len(moves) - len(searched)) + ' from the book, ' +
+              format(sum(nodes for nodes, seconds in searched) / max(len(searched), 1), '.0f') + ' nodes/move, time per move p50 ' +
+              format(percentile(latencies, 50), '.3f') + 's p90 ' + format(percentile(latencies, 90), '.3f') + 's p99 ' +
+              format(percentile(latencies, 99), '.3f') + 's max ' + format(latencies[-1] if latencies else 0, '.3f') + 's')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless self-play between two engine settings')
+    parser.add_argument('-n', '--games', type=int, default=10, help='games to play')
+    parser.add_argument('-w', '--workers', type=int, default=SmartMoveFinder.WORKERS, help='games played at once')
+    parser.add_argument('--engine1', default='', help='settings like depth=3,time=1,book=1')
+    parser.add_argument('--engine2', default='', help='settings for the other side')
+    parser.add_argument('--pgn', help='file to write the games to')
+    parser.add_argument('--seed', type=int, help='random seed, the same seed plays the same games')
+    args = parser.parse_args()
+    engine1 = EngineSettings.parse(args.engine1, 'engine1')
+    engine2 = EngineSettings.parse(args.engine2, 'engine2')
+    if engine1.name == engine2.name:
+        engine2.name += '-2'
+    runMatch(args.games, engine1, engine2, args.workers, args.pgn, args.seed)
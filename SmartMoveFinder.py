@@ -1,8 +1,47 @@
+import multiprocessing
+import os
 import random
+import time
+import ChessEngine
+import EndgameTables
+import OpeningBook
+import TranspositionTable
 
-pieceScore = {'K': 0, 'Q': 10, 'R': 5, 'B': 3, 'N': 3, 'p': 1}
-CHECKMATE = 1000
+pieceScore = ChessEngine.pieceScore # Pawns, the scores are these times 100
+CHECKMATE = 100000 # Scores are in centipawns
 STALEMATE = 0
+DEPTH = 3 # Deepest iteration of the search
+TIME_LIMIT = 5 # Seconds the search may take before it returns the best move found so far
+MATE_BOUND = CHECKMATE - 100 # Scores past this are checkmates, which get stored in the transposition table relative to the position
+HASH_SIZE = 16 # MB for the transposition table
+WORKERS = multiprocessing.cpu_count() # Processes findBestMoveParallel splits the root moves across
+MAX_PLY = 64 # Deepest ply that gets killer moves, the quiescence search stops there too
+BOOK_FILE = 'book.bin' # Opening book loadOpeningBook opens, build it with OpeningBook.py
+DELTA_MARGIN = 200 # A capture that can't bring the score back above alpha even with this much to spare isn't searched in quiescence
+
+# Move ordering. Moves are searched in order of these scores: the transposition table move, captures (most valuable victim, then least
+# valuable attacker), the killer moves of the ply and then the quiet moves by their history score
+TABLE_MOVE_SCORE = 1000000
+CAPTURE_SCORE = 100000
+KILLER_SCORE = 90000
+MAX_HISTORY_SCORE = 80000
+orderingValues = {'p': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 10}
+
+# Kept between searches so every AI turn starts with what the earlier ones found. Clear it when a new game starts
+transpositionTable = TranspositionTable.TranspositionTable(HASH_SIZE)
+
+nodesSearched = 0 # Positions visited by the last search
+searchDeadline = 0
+searchStopEvent = None # threading.Event another thread can set to stop the search early
+searchNodeLimit = float('inf') # The search stops after visiting this many positions
+searchAborted = False
+killerMoves = [[-1, -1] for ply in range(MAX_PLY)] # moveIDs of the last 2 quiet moves that caused a cutoff at each ply
+historyScores = {} # moveID: how much that quiet move has caused cutoffs, deeper cutoffs count more
+cutoffs = 0 # Beta cutoffs in the last search
+firstMoveCutoffs = 0 # Of those, the ones where the first move searched caused the cutoff
+openingBook = None # OpeningBook.OpeningBook, None when there is no book file
+workerPool = None # Process pool for findBestMoveParallel, kept between searches so each worker's transposition table stays warm
+workerPoolSize = 0
 
 '''
 Picks and returns a random move.
@@ -11,34 +50,386 @@ def findRandomMove(validMoves):
     return validMoves[random.randint(0, len(validMoves)-1)]
 
 '''
-Find the best move based on material alone.
+The line the search expects after move, following the best moves stored in the transposition table for up to length moves
+'''
+def getPrincipalVariation(gs, move, length):
+    line = [move]
+    gs.makeMove(move)
+    while len(line) < length:
+        moveID = tableMoveID(gs)
+        nextMove = None
+        for validMove in gs.getValidMoves():
+            if validMove.moveID == moveID:
+                nextMove = validMove
+        if nextMove is None:
+            break
+        line.append(nextMove)
+        gs.makeMove(nextMove)
+    for i in range(len(line)):
+        gs.undoMove()
+    return line
+
+'''
+Open the opening book at path, if there is one. Returns whether a book was opened
+'''
+def loadOpeningBook(path=BOOK_FILE):
+    global openingBook
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = OpeningBook.OpeningBook(path) if os.path.exists(path) else None
+    return openingBook is not None
+
+'''
+A move from the opening book for the position, picked at random weighted by how often it was played. None when the position isn't in the book
+'''
+def findBookMove(gs, validMoves):
+    if openingBook is None:
+        return None
+    return openingBook.findMove(gs, validMoves)
+
+'''
+Find the best move with a negamax alpha beta search. Iterative deepening searches 1 ply, then 2 and so on up to depth, trying the best move of
+the last iteration first. When timeLimit runs out, nodeLimit positions have been searched or stopEvent is set, the best move of the deepest
+search is returned. infoCallback(depth, score, move) is called after every finished iteration, with the score for the side to move.
+validMoves can be just some of the moves, to score them alone, the position's score then isn't stored in the transposition table.
+'''
+def findBestMove(gs, validMoves, depth=DEPTH, timeLimit=TIME_LIMIT, stopEvent=None, nodeLimit=None, infoCallback=None):
+    global nodesSearched, searchDeadline, searchStopEvent, searchNodeLimit, searchAborted
+    nodesSearched = 0
+    searchDeadline = time.perf_counter() + timeLimit
+    searchStopEvent = stopEvent
+    searchNodeLimit = nodeLimit if nodeLimit is not None else float('inf')
+    searchAborted = False
+    checkmate, stalemate = gs.checkmate, gs.stalemate # The search generates moves for positions deeper in the tree, which sets these
+    allMoves = len(validMoves) == len(gs.getValidMoves()) # The best of only some of the moves isn't the position's score
+    transpositionTable.newSearch()
+    newOrderingSearch()
+    rootMoves = list(validMoves)
+    random.shuffle(rootMoves) # Equal moves are picked at random
+    orderMoves(rootMoves, tableMoveID(gs), 0)
+    bestMove = None
+    for currentDepth in range(1, depth + 1):
+        move, score = findMoveNegaMaxAlphaBetaRoot(gs, rootMoves, currentDepth)
+        if move is not None: # Some of the moves were searched before the time ran out, with the last best move first
+            bestMove = move
+            rootMoves.remove(move)
+            rootMoves.insert(0, move)
+            if not searchAborted:
+                if allMoves:
+                    transpositionTable.store(gs.zobristKey, currentDepth, score, TranspositionTable.EXACT, move.moveID)
+                if infoCallback is not None:
+                    infoCallback(currentDepth, score, move)
+        if searchAborted or abs(score) >= CHECKMATE - depth: # Out of time or found a forced mate
+            break
+    gs.checkmate, gs.stalemate = checkmate, stalemate
+    return bestMove
+
+'''
+Root split parallel search. The root moves are dealt out to workers processes that each search their share on their own copy of the game,
+with iterative deepening up to depth and the same timeLimit. The shares are merged at the deepest depth every worker finished.
+Falls back to findBestMove for 1 worker. nodesSearched is the total over all the workers
 '''
-def findBestMove(gs, validMoves):
+def findBestMoveParallel(gs, validMoves, depth=DEPTH, timeLimit=TIME_LIMIT, workers=WORKERS):
+    global nodesSearched
+    if workers <= 1 or len(validMoves) <= 1:
+        return findBestMove(gs, validMoves, depth, timeLimit)
+    rootMoves = list(validMoves)
+    random.shuffle(rootMoves)
+    orderMoves(rootMoves, tableMoveID(gs), 0)
+    # Deal the moves out in turn so the likely best moves at the front don't all go to the same worker
+    shares = [[move.moveID for move in rootMoves[i::workers]] for i in range(workers)]
+    shares = [share for share in shares if share]
+    results = getWorkerPool(workers).starmap(searchRootMoves, [(gs, share, depth, timeLimit) for share in shares])
+    nodesSearched = sum(nodes for iterations, nodes in results)
+    commonDepth = min(len(iterations) for iterations, nodes in results)
+    if commonDepth > 0:
+        candidates = [iterations[commonDepth - 1] for iterations, nodes in results]
+    else: # Some worker couldn't finish even 1 ply, take the best 1 ply result of the others
+        candidates = [iterations[0] for iterations, nodes in results if iterations]
+        if not candidates: # None finished, the first move in search order is the best guess
+            return rootMoves[0]
+    bestDepth, bestMoveID, bestScore = max(candidates, key=lambda iteration: iteration[2])
+    for move in validMoves:
+        if move.moveID == bestMoveID:
+            return move
+
+'''
+Runs in a worker process. Iterative deepening over just the root moves in moveIDs. Returns (depth, moveID, score) for every depth it finished,
+and the nodes searched
+'''
+def searchRootMoves(gs, moveIDs, depth, timeLimit):
+    global nodesSearched, searchDeadline, searchStopEvent, searchNodeLimit, searchAborted
+    nodesSearched = 0
+    searchDeadline = time.perf_counter() + timeLimit
+    searchStopEvent = None
+    searchNodeLimit = float('inf')
+    searchAborted = False
+    transpositionTable.newSearch()
+    newOrderingSearch()
+    rootMoves = [move for move in gs.getValidMoves() if move.moveID in moveIDs] # Generated from this copy of the game so they point at its board
+    orderMoves(rootMoves, tableMoveID(gs), 0)
+    iterations = []
+    for currentDepth in range(1, depth + 1):
+        move, score = findMoveNegaMaxAlphaBetaRoot(gs, rootMoves, currentDepth)
+        if searchAborted: # Only whole iterations can be compared between workers
+            break
+        iterations.append((currentDepth, move.moveID, score))
+        rootMoves.remove(move)
+        rootMoves.insert(0, move)
+        if abs(score) >= CHECKMATE - depth:
+            break
+    return iterations, nodesSearched
+
+'''
+The process pool for findBestMoveParallel, started the first time it is needed or when the number of workers changes
+'''
+def getWorkerPool(workers):
+    global workerPool, workerPoolSize
+    if workerPool is None or workerPoolSize != workers:
+        closeWorkerPool()
+        workerPool = multiprocessing.Pool(workers)
+        workerPoolSize = workers
+    return workerPool
+
+def closeWorkerPool():
+    global workerPool, workerPoolSize
+    if workerPool is not None:
+        workerPool.terminate()
+        workerPool.join()
+    workerPool = None
+    workerPoolSize = 0
+
+'''
+Search every root move to depth and return the best one with its score. The move is None when time ran out before the first move finished
+'''
+def findMoveNegaMaxAlphaBetaRoot(gs, validMoves, depth):
     turnMultiplier = 1 if gs.whiteToMove else -1
-    maxScore = -CHECKMATE
+    alpha, beta = -CHECKMATE, CHECKMATE
     bestMove = None
-    for playerMove in validMoves:
-        gs.makeMove(playerMove)
-        if gs.checkmate:
-            score = CHECKMATE
-        elif gs.stalemate:
-            score = 0
-        score = turnMultiplier * scoreMaterial(gs.board)
+    for move in validMoves:
+        gs.makeMove(move)
+        nextMoves = gs.getValidMoves()
+        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, 1)
+        gs.undoMove()
+        if searchAborted:
+            break
+        if score > alpha or bestMove is None:
+            alpha = score
+            bestMove = move
+    return bestMove, alpha
+
+'''
+Negamax with alpha beta pruning. Scores are from the point of view of the side to move (turnMultiplier 1 for white, -1 for black).
+Checkmates closer to the root score higher, so the search goes for the quickest mate.
+'''
+def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier, ply):
+    global nodesSearched, searchAborted, cutoffs, firstMoveCutoffs
+    nodesSearched += 1
+    if nodesSearched > searchNodeLimit or time.perf_counter() > searchDeadline or (searchStopEvent is not None and searchStopEvent.is_set()):
+        searchAborted = True
+        return 0
+    if len(validMoves) == 0:
+        return -CHECKMATE + ply if gs.inCheck() else STALEMATE
+    if gs.pieceCount <= EndgameTables.MAX_PIECES:
+        tableScore = scoreFromEndgameTables(gs, ply)
+        if tableScore is not None:
+            return tableScore
+    if depth == 0:
+        return quiescence(gs, alpha, beta, turnMultiplier, ply)
+
+    # A search of this position that went at least as deep can answer for this one or narrow the window
+    alphaOrig = alpha
+    bestTableMoveID = -1
+    entry = transpositionTable.probe(gs.zobristKey)
+    if entry is not None:
+        tableDepth, tableScore, bound, bestTableMoveID = entry
+        if tableDepth >= depth:
+            tableScore = scoreFromTable(tableScore, ply)
+            if bound == TranspositionTable.EXACT:
+                return tableScore
+            elif bound == TranspositionTable.LOWER:
+                alpha = max(alpha, tableScore)
+            else:
+                beta = min(beta, tableScore)
+            if alpha >= beta:
+                return tableScore
+    orderMoves(validMoves, bestTableMoveID, ply)
+
+    maxScore = -CHECKMATE
+    bestMoveID = -1
+    for i, move in enumerate(validMoves):
+        gs.makeMove(move)
+        nextMoves = gs.getValidMoves()
+        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+        gs.undoMove()
+        if searchAborted:
+            return 0
         if score > maxScore:
-            score = maxScore
-            bestMove = playerMove
-    return bestMove
+            maxScore = score
+            bestMoveID = move.moveID
+        if maxScore > alpha:
+            alpha = maxScore
+        if alpha >= beta: # Pruning, the opponent won't allow this line
+            cutoffs += 1
+            if i == 0:
+                firstMoveCutoffs += 1
+            if move.pieceCaptured == '--' and move.promotionPiece is None:
+                storeKillerMove(move.moveID, ply, depth)
+            break
+
+    if maxScore <= alphaOrig:
+        bound = TranspositionTable.UPPER
+    elif maxScore >= beta:
+        bound = TranspositionTable.LOWER
+    else:
+        bound = TranspositionTable.EXACT
+    transpositionTable.store(gs.zobristKey, depth, scoreToTable(maxScore, ply), bound, bestMoveID)
+    return maxScore
+
+'''
+Quiescence search, keep playing captures (and promotions) past the end of the main search until the position is quiet, so the score isn't taken
+in the middle of an exchange. The side to move can stand pat on the static score instead of capturing, unless it is in check,
+then every move is searched.
+'''
+def quiescence(gs, alpha, beta, turnMultiplier, ply):
+    global nodesSearched, searchAborted
+    nodesSearched += 1
+    if nodesSearched > searchNodeLimit or time.perf_counter() > searchDeadline or (searchStopEvent is not None and searchStopEvent.is_set()):
+        searchAborted = True
+        return 0
+    if gs.pieceCount <= EndgameTables.MAX_PIECES:
+        tableScore = scoreFromEndgameTables(gs, ply)
+        if tableScore is not None:
+            return tableScore
+    inCheck = gs.inCheck()
+    standPat = turnMultiplier * scoreBoard(gs)
+    if inCheck:
+        moves = gs.getValidMoves()
+        if len(moves) == 0:
+            return -CHECKMATE + ply
+        maxScore = -CHECKMATE
+    else:
+        if standPat >= beta or ply >= MAX_PLY:
+            return standPat
+        moves = gs.getValidMoves(capturesOnly=True)
+        maxScore = standPat
+        if standPat > alpha:
+            alpha = standPat
+    orderMoves(moves, -1, ply)
+
+    for move in moves:
+        # Delta pruning, even winning the captured piece for free wouldn't be enough
+        if not inCheck and move.promotionPiece is None and standPat + abs(ChessEngine.pieceMaterial[move.pieceCaptured]) + DELTA_MARGIN <= alpha:
+            continue
+        gs.makeMove(move)
+        score = -quiescence(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+        gs.undoMove()
+        if searchAborted:
+            return 0
+        if score > maxScore:
+            maxScore = score
+        if maxScore > alpha:
+            alpha = maxScore
+        if alpha >= beta:
+            break
+    return maxScore
+
+'''
+The exact score of the position from the endgame tables, a mate score counted from the root or 0 for a draw. None when it isn't in the tables
+'''
+def scoreFromEndgameTables(gs, ply):
+    result = EndgameTables.probe(gs)
+    if result is None:
+        return None
+    outcome, plies = result
+    return outcome * (CHECKMATE - ply - plies)
+
+'''
+Sort the moves best first for the search: the table move, then captures by MVV-LVA (and queen promotions), then the killer moves for this ply
+and then the quiet moves by history score. The sort is stable so moves that score the same keep their order
+'''
+def orderMoves(moves, tableMoveID, ply):
+    killers = killerMoves[ply] if ply < MAX_PLY else (-1, -1)
+    moves.sort(key=lambda move: orderingScore(move, tableMoveID, killers), reverse=True)
+
+def orderingScore(move, tableMoveID, killers):
+    moveID = move.moveID
+    if moveID == tableMoveID:
+        return TABLE_MOVE_SCORE
+    if move.pieceCaptured != '--':
+        score = CAPTURE_SCORE + 10 * orderingValues[move.pieceCaptured[1]] - orderingValues[move.pieceMoved[1]]
+        if move.promotionPiece == 'Q':
+            score += 10 * orderingValues['Q']
+        return score
+    if move.promotionPiece == 'Q':
+        return CAPTURE_SCORE + 10 * orderingValues['Q']
+    if moveID == killers[0]:
+        return KILLER_SCORE + 1
+    if moveID == killers[1]:
+        return KILLER_SCORE
+    return historyScores.get(moveID, 0)
+
+'''
+Remember a quiet move that caused a cutoff, as a killer move for the ply and in the history scores
+'''
+def storeKillerMove(moveID, ply, depth):
+    if ply < MAX_PLY:
+        killers = killerMoves[ply]
+        if killers[0] != moveID:
+            killers[1] = killers[0]
+            killers[0] = moveID
+    historyScores[moveID] = min(historyScores.get(moveID, 0) + depth * depth, MAX_HISTORY_SCORE)
+
+'''
+Reset the killer moves and cutoff counters and age the history scores, at the start of a search
+'''
+def newOrderingSearch():
+    global cutoffs, firstMoveCutoffs
+    for killers in killerMoves:
+        killers[0] = killers[1] = -1
+    for moveID in list(historyScores):
+        historyScores[moveID] //= 2
+    cutoffs = 0
+    firstMoveCutoffs = 0
+
+'''
+How well the moves were ordered in the last search, the fraction of cutoffs caused by the first move searched
+'''
+def getOrderingStats():
+    return {'cutoffs': cutoffs, 'firstMoveCutoffs': firstMoveCutoffs, 'firstMoveCutoffRate': firstMoveCutoffs / cutoffs if cutoffs else 0.0}
+
+'''
+The moveID of the best move the transposition table has for this position, -1 if there is none
+'''
+def tableMoveID(gs):
+    entry = transpositionTable.probe(gs.zobristKey)
+    return entry[3] if entry is not None else -1
+
+'''
+Mate scores count plies from the root, the table stores them counting from the position so they are right wherever it shows up again
+'''
+def scoreToTable(score, ply):
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+'''
+Score the board based on material and where the pieces stand, positive is good for white. GameState keeps both up to date as moves are made
+'''
+def scoreBoard(gs):
+    return gs.materialScore + gs.positionScore
 
 '''
-Score the board based on material
+Material on a board from scratch in centipawns, positive is good for white. The same as the material part of GameState.computeScores
 '''
 def scoreMaterial(board):
-    score = 0
-    for row in board:
-        for square in row:
-            if square[0] == 'w':
-                score += pieceScore[square[1]]
-            elif square[0] == 'b':
-                score -= pieceScore[square[1]]
-
-    return score
\ No newline at end of file
+    return sum(ChessEngine.pieceMaterial[square] for row in board for square in row)
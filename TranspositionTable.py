@@ -0,0 +1,100 @@
+'''
+Fixed size transposition table for the search. Positions are looked up by their Zobrist key (GameState.zobristKey) and each entry keeps the
+depth that position was searched to, its score, what kind of bound the score is and the best move found there.
+The entries live in flat arrays, so the memory used is set when the table is made and never grows.
+'''
+from array import array
+
+# Bound types
+EXACT = 1 # Score is the exact value of the position
+LOWER = 2 # Search failed high, the position is worth at least the score
+UPPER = 3 # Search failed low, the position is worth at most the score
+
+ENTRY_BYTES = 8 + 1 + 4 + 1 + 4 + 1 # key, depth, score, bound, move, age
+
+class TranspositionTable():
+    def __init__(self, sizeMB=16):
+        # Round down to a power of two so a key can be turned into an index with a mask
+        entries = max(1, sizeMB * 1024 * 1024 // ENTRY_BYTES)
+        self.size = 1 << (entries.bit_length() - 1)
+        self.mask = self.size - 1
+        self.keys = array('Q', bytes(8 * self.size))
+        self.depths = array('b', bytes(self.size))
+        self.scores = array('i', bytes(4 * self.size))
+        self.bounds = array('B', bytes(self.size)) # 0 means the slot is empty
+        self.moves = array('i', bytes(4 * self.size)) # moveID of the best move, -1 when there isn't one
+        self.ages = array('B', bytes(self.size))
+        self.age = 0
+        self.resetStats()
+
+    '''
+    Zero the hit/miss/collision counters
+    '''
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0 # Probes that found a different position in the slot
+        self.stores = 0
+        self.replacements = 0 # Stores that overwrote a different position
+
+    '''
+    Empty the table, for when a new game starts
+    '''
+    def clear(self):
+        self.bounds = array('B', bytes(self.size))
+        self.age = 0
+        self.resetStats()
+
+    '''
+    Call at the start of every search. Entries from older searches are replaced before deeper ones from the current search
+    '''
+    def newSearch(self):
+        self.age = (self.age + 1) & 255
+
+    '''
+    Look up a position. Returns (depth, score, bound, moveID) or None when it isn't in the table
+    '''
+    def probe(self, key):
+        self.probes += 1
+        i = key & self.mask
+        if self.bounds[i] == 0:
+            self.misses += 1
+            return None
+        if self.keys[i] != key:
+            self.misses += 1
+            self.collisions += 1
+            return None
+        self.hits += 1
+        return self.depths[i], self.scores[i], self.bounds[i], self.moves[i]
+
+    '''
+    Store the result of searching a position. An entry for another position is only replaced when it is from an older search or was not
+    searched deeper than this one
+    '''
+    def store(self, key, depth, score, bound, moveID=-1):
+        i = key & self.mask
+        if self.bounds[i] != 0:
+            if self.keys[i] == key:
+                if moveID == -1: # Keep the best move we already know for this position
+                    moveID = self.moves[i]
+            elif self.ages[i] == self.age and self.depths[i] > depth:
+                return
+            else:
+                self.replacements += 1
+        self.stores += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.scores[i] = score
+        self.bounds[i] = bound
+        self.moves[i] = moveID
+        self.ages[i] = self.age
+
+    '''
+    Counters as a dict, with the hit rate and how full the table is
+    '''
+    def getStats(self):
+        used = self.size - self.bounds.count(0)
+        return {'size': self.size, 'used': used, 'probes': self.probes, 'hits': self.hits, 'misses': self.misses,
+                'collisions': self.collisions, 'stores': self.stores, 'replacements': self.replacements,
+                'hitRate': self.hits / self.probes if self.probes else 0.0}
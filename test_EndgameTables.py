@@ -0,0 +1,30 @@
+'''
+Tests for EndgameTables.
+    python -m pytest test_EndgameTables.py
+'''
+import shutil
+import tempfile
+import unittest
+import EndgameTables
+
+class TestEndgameTables(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        EndgameTables.loadedTables.pop('KRvK', None)
+
+    def tearDown(self):
+        EndgameTables.loadedTables.pop('KRvK', None)
+        shutil.rmtree(self.directory)
+
+    def testTableBuiltInTheSameRunIsProbed(self):
+        # A 4 piece table probes the 3 piece tables it captures into right after generating them, they must not be cached as missing
+        self.assertIsNone(EndgameTables.getTable('KRvK', self.directory))
+        EndgameTables.generateTable('KRvK', self.directory, verbose=False)
+        self.assertIsNotNone(EndgameTables.getTable('KRvK', self.directory))
+        # Left after a rook takes the knight in KRvKN: white king a1, rook b2, black king h8, white to move wins
+        result = EndgameTables.probePieces([('wK', 56), ('wR', 49), ('bK', 7)], True, self.directory)
+        self.assertIsNotNone(result)
+        self.assertGreater(result[0], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+'''
+Tests for GameAnalysis.
+    python -m pytest test_GameAnalysis.py
+'''
+import unittest
+import ChessEngine
+import GameAnalysis
+import SmartMoveFinder
+
+class TestGameAnalysis(unittest.TestCase):
+    def setUp(self):
+        gs = ChessEngine.GameState()
+        for san in ('e4', 'e5', 'Bc4', 'Nc6'):
+            gs.makeMove(gs.parseMove(san))
+        self.parent = gs.getFEN()
+        gs.makeMove(gs.parseMove('Qh5'))
+        self.child = gs.getFEN()
+
+    def testChildDoesNotChangeParent(self):
+        for depth in (2, 3):
+            before = GameAnalysis.analysePosition((1, 4, self.parent, 'Qh5'), depth)
+            GameAnalysis.analysePosition((1, 5, self.child, 'Nf6'), depth)
+            after = GameAnalysis.analysePosition((1, 4, self.parent, 'Qh5'), depth)
+            self.assertEqual((before['bestMove'], before['score'], before['loss']), (after['bestMove'], after['score'], after['loss']))
+            self.assertLess(abs(after['score']), SmartMoveFinder.MATE_BOUND)
+
+    def testBestMoveLosesNothing(self):
+        row = GameAnalysis.analysePosition((1, 4, self.parent, ''), 2)
+        played = GameAnalysis.analysePosition((1, 4, self.parent, row['bestMove']), 2)
+        self.assertEqual(played['loss'], 0)
+
+    def testSomeRootMovesAreNotStored(self):
+        gs = ChessEngine.GameState(self.child)
+        SmartMoveFinder.transpositionTable.clear()
+        SmartMoveFinder.findBestMove(gs, [gs.parseMove('Nf6')], 2, float('inf'))
+        self.assertIsNone(SmartMoveFinder.transpositionTable.probe(gs.zobristKey))
+
+if __name__ == '__main__':
+    unittest.main()
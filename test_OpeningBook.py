@@ -0,0 +1,51 @@
+'''
+Tests for OpeningBook.
+    python -m pytest test_OpeningBook.py
+'''
+import os
+import shutil
+import tempfile
+import unittest
+import ChessEngine
+import OpeningBook
+
+FEN = 'r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/8/PPPP1PPP/RNBQK1NR w KQkq - 2 3'
+PGN = ('[Event "From a position"]\n[FEN "' + FEN + '"]\n\n3. Qh5 Nf6 *\n\n' +
+       '[Event "Illegal"]\n\n1. e4 e5 2. Ke3 *\n\n' +
+       '[Event "Bad FEN"]\n[FEN "not a position"]\n\n1. e4 *\n\n' +
+       '1. d4 d5 *\n')
+
+class TestOpeningBook(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeFile(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as gameFile:
+            gameFile.write(text)
+        return path
+
+    def testFENGamesAndBadGames(self):
+        errors = []
+        bookPath = os.path.join(self.directory, 'book.bin')
+        OpeningBook.buildBook(OpeningBook.readGames(self.writeFile('games.pgn', PGN)), bookPath, errors=errors)
+        self.assertEqual([(gameNumber, ply) for gameNumber, ply, error in errors], [(2, 2), (3, 0)])
+        book = OpeningBook.OpeningBook(bookPath)
+        try:
+            gs = ChessEngine.GameState(FEN)
+            self.assertEqual(book.getMoves(gs.zobristKey), [(gs.parseMove('Qh5').moveID, 1)])
+            gs = ChessEngine.GameState()
+            self.assertEqual(book.getMoves(gs.zobristKey), [(gs.parseMove('d4').moveID, 1)]) # Nothing from the illegal game's e4
+        finally:
+            book.close()
+
+    def testMoveListFile(self):
+        games = list(OpeningBook.readGames(self.writeFile('games.txt', '# openings\ne2e4 e7e5\nd4 d5\n')))
+        self.assertEqual([game.moves for game in games], [['e2e4', 'e7e5'], ['d4', 'd5']])
+        self.assertEqual(games[0].tags, {})
+
+if __name__ == '__main__':
+    unittest.main()
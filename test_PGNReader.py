@@ -0,0 +1,43 @@
+'''
+Tests for PGNReader.
+    python -m pytest test_PGNReader.py
+'''
+import unittest
+import PGNReader
+
+class TestPGNReader(unittest.TestCase):
+    def readGames(self, text):
+        return list(PGNReader.readGames(text.splitlines()))
+
+    def testCastlingWithZeros(self):
+        games = self.readGames('1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. 0-0 d6 5. d3 Be6 6. Nc3 Qd7 7. Be3 Nf6 8. Qd2 0-0-0 *')
+        self.assertEqual(games[0].moves[6], '0-0')
+        self.assertEqual(games[0].moves[15], '0-0-0')
+        errors = []
+        positions = list(PGNReader.iterPositions(games, errors))
+        self.assertEqual(errors, [])
+        self.assertEqual(len(positions), 17) # Every move and the last position
+        self.assertIn('2kr3r', positions[-1][2])
+
+    def testMoveNumbersWrittenTogether(self):
+        games = self.readGames('1.e4 e5 2.Nf3 2...Nc6 3.Bb5 a6 1-0')
+        self.assertEqual(games[0].moves, ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5', 'a6'])
+        self.assertEqual(games[0].result, '1-0')
+
+    def testCommentsVariationsAndTags(self):
+        text = '[Event "Test \\"quoted\\""]\n[White "A"]\n\n1. e4 {a comment (with a\nbracket} e5 2. Nf3 (2. f4 exf4 (2... d5) 3. Nf3) Nc6 $1 ; rest\n3. Bb5!? 1/2-1/2\n[Event "Second"]\n\n1. d4 *\n'
+        games = self.readGames(text)
+        self.assertEqual(len(games), 2)
+        self.assertEqual(games[0].tags, {'Event': 'Test "quoted"', 'White': 'A'})
+        self.assertEqual(games[0].moves, ['e4', 'e5', 'Nf3', 'Nc6', 'Bb5'])
+        self.assertEqual(games[1].moves, ['d4'])
+
+    def testInvalidMoveStopsTheGame(self):
+        errors = []
+        positions = list(PGNReader.iterPositions(self.readGames('1. e4 e5 2. Qz9 *'), errors))
+        self.assertEqual(len(positions), 3)
+        self.assertEqual(positions[-1][3], '')
+        self.assertEqual(errors[0][:2], (1, 2))
+
+if __name__ == '__main__':
+    unittest.main()